@@ -1,3 +1,10 @@
+import os
+
+# Cap BLAS/OpenMP pools before numpy loads: concurrent mobile requests each run
+# their own recognition, and per-call BLAS threads would oversubscribe the cores
+for _var in ('OPENBLAS_NUM_THREADS', 'OMP_NUM_THREADS', 'MKL_NUM_THREADS'):
+    os.environ.setdefault(_var, '2')
+
 import cv2
 from flask_cors import CORS
 from mobile_routes import register_mobile_routes
@@ -5,6 +12,7 @@ from flask import (
     Flask, render_template, request, jsonify, Response,
     redirect, url_for, session, flash, send_file)
 import threading
+import logging
 import multiprocessing
 import json
 import time
@@ -21,6 +29,7 @@ from functools import wraps
 import json
 import os
 from datetime import datetime
+import attendance_system
 from attendance_system import main as attendance_main, atomic_write_json, load_student_data, save_student_data
 from curriculum_toggle import get_state as get_curriculum_state, toggle as toggle_curriculum
 # Import IP access control
@@ -651,24 +660,15 @@ CURRICULUM_JSON = "curriculum.json"
 # (functions that read/write JSON storage files)
 # -----------------------------
 
-def load_attendance_records():
-    """Load attendance records from JSON file"""
+def load_attendance_records(key=None):
+    """Load attendance records (read-only copy, including marks not yet written to disk).
+    Pass key ("YYYY-MM-DD_Lecture") when only that lecture is needed."""
     try:
-        with open('attendance_records.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {'records': {}}
+        return attendance_system.snapshot_attendance_records(key)
     except Exception as e:
         print(f"[ERROR] Failed to load attendance_records.json: {e}")
         return {'records': {}}
 
-def save_attendance_records(data):
-    """Save attendance records to JSON file"""
-    try:
-        atomic_write_json('attendance_records.json', data)
-    except Exception as e:
-        print(f"[ERROR] Failed to save attendance_records.json: {e}")
-
 def init_database():
     """Initialize JSON files if they don't exist"""
     if not os.path.exists(ATTENDANCE_RECORDS_JSON):
@@ -971,13 +971,7 @@ def collect_lecture_data():
     if not subject:
         return None
 
-    try:
-        with open('attendance_records.json', 'r', encoding='utf-8') as f:
-            data = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {'teacher_id': teacher_id, 'subject': subject, 'total_lectures': 0, 'lectures': []}
-
-    records = data.get('records', {})
+    records = load_attendance_records().get('records', {})
     lectures = []
 
     subj_norm = subject.lower()
@@ -1769,12 +1763,12 @@ def finalize_attendance():
             return jsonify({'success': False, 'message': 'Date required'})
 
         # Load attendance records
-        attendance_data = load_attendance_records()
         date_key = f"{date}_{lecture}"
+        attendance_data = load_attendance_records(date_key)
         
         if date_key in attendance_data.get('records', {}):
-            # Save the finalized records
-            save_attendance_records(attendance_data)
+            # Make sure every mark made so far is on disk
+            attendance_system.flush_pending_writes()
             return jsonify({
                 'success': True, 
                 'message': 'Attendance finalized',
@@ -1812,11 +1806,10 @@ def clear_attendance():
         if not date:
             return jsonify({'success': False, 'message': 'Date required'}), 400
 
-        attendance = load_attendance_records()
         key = f"{date}_{lecture}"
-        if key in attendance.get('records', {}):
-            removed = attendance['records'].pop(key)
-            save_attendance_records(attendance)
+        removed = attendance_system.update_attendance_records(
+            lambda attendance: attendance.get('records', {}).pop(key, None))
+        if removed is not None:
             affected = len(removed.get('present', [])) + len(removed.get('absent', []))
             return jsonify({
                 'success': True,
@@ -2345,10 +2338,10 @@ def debug_attendance_status():
         lecture = session.get('lecture', '') or session.get('selected_subject', '')
         today = datetime.now().strftime("%Y-%m-%d")
 
-        attendance = load_attendance_records()
+        key = f"{today}_{lecture}"
+        attendance = load_attendance_records(key)
         student_data = load_student_data()
 
-        key = f"{today}_{lecture}"
         rec = attendance.get('records', {}).get(key, {})
         present = rec.get('present', [])
         absent = rec.get('absent', [])
@@ -2402,24 +2395,13 @@ def mark_absent_for_unmarked_students(lecture, marked_by="system"):
             print(f"[WARN] No students found enrolled in {lecture}")
             return
 
-        # Load attendance JSON and mark absent where necessary
-        attendance = load_attendance_records()
-        key = f"{today}_{lecture}"
-        if key not in attendance.get('records', {}):
-            attendance.setdefault('records', {})[key] = {'present': [], 'absent': [], 'time': current_time}
-
-        today_rec = attendance['records'][key]
-        present_students = set(today_rec.get('present', []))
-        absent_students = set(today_rec.get('absent', []))
-
-        absent_count = 0
-        for student in enrolled_students:
-            sid = student['student_id']
-            if sid not in present_students and sid not in absent_students:
-                today_rec.setdefault('absent', []).append(sid)
-                absent_count += 1
+        # Marked in the live records, so scans that are still coming in are kept
+        # Only the roster changes here; student totals are not touched
+        marked = attendance_system.bulk_mark_absent(
+            [student['student_id'] for student in enrolled_students], lecture,
+            init_totals=False)
+        absent_count = len(marked)
 
-        save_attendance_records(attendance)
         print(f"[SUCCESS] Marked {absent_count} students as absent for {lecture} on {today}")
     except Exception as e:
         print(f"[ERROR] Failed to mark absent students for {lecture}: {e}")
@@ -2444,21 +2426,35 @@ def generate_frames():
             time.sleep(0.05)
 
 
+# Number of open /video_feed streams; the recognition loop only encodes frames while > 0
+_viewer_lock = threading.Lock()
+
+
+def _change_viewer_count(delta):
+    with _viewer_lock:
+        shared_data['viewer_count'] = max(0, shared_data.get('viewer_count', 0) + delta)
+
+
 @app.route('/video_feed')
 def video_feed():
     def generate():
         last_frame_time = 0
+        _change_viewer_count(1)
         
-        while True:
-            if 'frame_jpeg' in shared_data and 'frame_updated' in shared_data:
-                if shared_data['frame_updated'] > last_frame_time:
-                    last_frame_time = shared_data['frame_updated']
-                    
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + 
-                           shared_data['frame_jpeg'] + b'\r\n')
-            
-            time.sleep(0.033)  # Check 30 times/sec - FASTER CHECKS
+        try:
+            while True:
+                if 'frame_jpeg' in shared_data and 'frame_updated' in shared_data:
+                    if shared_data['frame_updated'] > last_frame_time:
+                        last_frame_time = shared_data['frame_updated']
+                        
+                        yield (b'--frame\r\n'
+                               b'Content-Type: image/jpeg\r\n\r\n' + 
+                               shared_data['frame_jpeg'] + b'\r\n')
+                
+                time.sleep(0.033)  # Check 30 times/sec - FASTER CHECKS
+        finally:
+            # Runs when the client disconnects and the generator is closed
+            _change_viewer_count(-1)
     
     return Response(generate(),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
@@ -2527,10 +2523,15 @@ register_mobile_routes(app)
 
 if __name__ == '__main__':
     multiprocessing.freeze_support()
+    # Gives the module loggers (curriculum_toggle, app.logger) a handler at INFO.
+    # attendance_system's per-frame match diagnostics are DEBUG: run with LOG_LEVEL=DEBUG to see them.
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+                        format="[%(levelname)s] %(name)s: %(message)s")
     manager = multiprocessing.Manager()
     shared_data = manager.dict()
     shared_data['running'] = False
     shared_data['frame_jpeg'] = None
+    shared_data['viewer_count'] = 0
 
     # Initialize database
     init_database()
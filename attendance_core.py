@@ -1,3 +1,4 @@
+import functools
 import json
 import os
 import pickle
@@ -6,7 +7,12 @@ import cv2
 import face_recognition
 from datetime import datetime
 import tempfile
-import shutil
+from json_io import json_loads as _json_loads
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # File paths
 ENCODE_FILE = "EncodeFile.p"
@@ -14,6 +20,18 @@ ATTENDANCE_RECORDS_JSON = 'attendance_records.json'
 STUDENT_DATA_JSON = 'student_data.json'
 CURRENT_STUDENT_JSON = "current_student.json"
 CURRENT_TEACHER_JSON = "current_teacher.json"
+CURRICULUM_JSON = "curriculum.json"
+
+
+# ============================================================================
+# JSON HELPERS (orjson when available, stdlib json otherwise)
+# ============================================================================
+
+def _json_dumps(data):
+    """Serialize to indented UTF-8 bytes"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
 
 
 # ============================================================================
@@ -23,8 +41,8 @@ CURRENT_TEACHER_JSON = "current_teacher.json"
 def load_attendance_records():
     """Load attendance records from JSON"""
     try:
-        with open(ATTENDANCE_RECORDS_JSON, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        with open(ATTENDANCE_RECORDS_JSON, 'rb') as f:
+            return _json_loads(f.read())
     except FileNotFoundError:
         return {'records': {}}
     except Exception as e:
@@ -40,17 +58,18 @@ def save_attendance_records(data):
         print(f"[ERROR] Failed to save attendance records: {e}")
 
 
-def atomic_write_json(path, data):
-    """Atomic JSON file write"""
+def atomic_write_json(path, data, durable=True):
+    """Atomic JSON file write (durable=False skips fsync for regenerable files)"""
     dirpath = os.path.dirname(path) or "."
     os.makedirs(dirpath, exist_ok=True)
     fd, tmp_path = tempfile.mkstemp(dir=dirpath)
     try:
-        with os.fdopen(fd, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-            f.flush()
-            os.fsync(f.fileno())
-        shutil.move(tmp_path, path)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_json_dumps(data))
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
     except Exception:
         if os.path.exists(tmp_path):
             os.remove(tmp_path)
@@ -60,8 +79,8 @@ def atomic_write_json(path, data):
 def load_student_data():
     """Load student data from JSON - handles batch structure"""
     try:
-        with open(STUDENT_DATA_JSON, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        with open(STUDENT_DATA_JSON, 'rb') as f:
+            data = _json_loads(f.read())
 
             # Normalize batch structure
             if isinstance(data, dict):
@@ -119,8 +138,8 @@ def save_student_data(students_dict):
         existing = None
         if os.path.exists(STUDENT_DATA_JSON):
             try:
-                with open(STUDENT_DATA_JSON, 'r', encoding='utf-8') as f:
-                    existing = json.load(f)
+                with open(STUDENT_DATA_JSON, 'rb') as f:
+                    existing = _json_loads(f.read())
             except Exception:
                 existing = None
 
@@ -172,24 +191,34 @@ def save_student_data(students_dict):
 def get_current_lecture():
     """Get current lecture/subject from teacher data"""
     try:
-        with open(CURRENT_TEACHER_JSON, "r", encoding='utf-8') as f:
-            teacher_data = json.load(f)
+        with open(CURRENT_TEACHER_JSON, 'rb') as f:
+            teacher_data = _json_loads(f.read())
             return teacher_data.get('lecture', 'Default')
     except:
         return 'Default'
 
 
+@functools.lru_cache(maxsize=1)
+def _curriculum_index(mtime_ns):
+    """Build subject -> year lookup from curriculum (cached per file version)"""
+    with open(CURRICULUM_JSON, 'rb') as f:
+        curriculum = _json_loads(f.read())
+
+    index = {}
+    for year, year_data in curriculum.items():
+        if not isinstance(year_data, dict):
+            continue
+        for sem_name, sem_data in year_data.get("Semesters", {}).items():
+            for subject in sem_data.get("Theory", []) + sem_data.get("Practicals", []):
+                index.setdefault(subject, year)
+    return index
+
+
 def get_subject_year(subject_name):
     """Find which year a subject belongs to from curriculum"""
     try:
-        with open("curriculum.json", "r", encoding="utf-8") as f:
-            curriculum = json.load(f)
-
-        for year, year_data in curriculum.items():
-            for sem_name, sem_data in year_data.get("Semesters", {}).items():
-                all_subjects = sem_data.get("Theory", []) + sem_data.get("Practicals", [])
-                if subject_name in all_subjects:
-                    return year
+        mtime_ns = os.stat(CURRICULUM_JSON).st_mtime_ns
+        return _curriculum_index(mtime_ns).get(subject_name)
     except Exception as e:
         print(f"[ERROR] Could not determine year for subject '{subject_name}': {e}")
 
@@ -416,8 +445,8 @@ def recognize_face_and_mark_attendance(image, source="unknown"):
         if success:
             # Save current student info
             try:
-                with open(CURRENT_TEACHER_JSON, 'r', encoding='utf-8') as f:
-                    teacher_info = json.load(f)
+                with open(CURRENT_TEACHER_JSON, 'rb') as f:
+                    teacher_info = _json_loads(f.read())
             except:
                 teacher_info = {'name': '', 'lecture': current_lecture}
             
@@ -470,7 +499,7 @@ def save_current_student_json(student_info, teacher_info):
             'lecture': teacher_info.get('lecture', '')
         }
         
-        atomic_write_json(CURRENT_STUDENT_JSON, data)
+        atomic_write_json(CURRENT_STUDENT_JSON, data, durable=False)
         print(f"[SUCCESS] Saved current_student.json for {student_id}")
         
     except Exception as e:
@@ -1,6 +1,9 @@
+import io
 import json
 import os
 import pickle
+import logging
+import multiprocessing
 import numpy as np
 import cv2
 import face_recognition
@@ -10,9 +13,34 @@ try:
     from ultralytics import YOLO
 except Exception:
     YOLO = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR
+    _tj = TurboJPEG()
+except Exception:
+    # PyTurboJPEG missing or libturbojpeg not found: cv2.imencode is used instead
+    _tj = None
 import tempfile
-import shutil
 import time
+import atexit
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from json_io import json_loads as _json_loads, fsync_dir as _fsync_dir
+from face_encoding_worker import fix_image_format, encode_image_file
+
+logger = logging.getLogger(__name__)
 
 # -----------------------------
 # SECTION: Constants & file paths
@@ -21,14 +49,87 @@ import time
 
 STUDENT_IMAGES_FOLDER = os.path.join("static", "student_images")
 ENCODE_FILE = "EncodeFile.p"
+# Pickle-free copy of ENCODE_FILE: raw float32 matrix + JSON ids (with the pickle stamp it came from)
+ENCODE_MATRIX_FILE = "EncodeFile.npy"
+ENCODE_IDS_FILE = "EncodeFile.ids.json"
+FACE_DETECTOR_MODEL = os.path.join("models", "face_detection_yunet.onnx")
+SPOOF_MODEL = os.path.join("models", "l_version_1_214.pt")
+# Optional export of the same model: model.export(format='onnx', half=True, imgsz=224)
+SPOOF_MODEL_ONNX = os.path.join("models", "l_version_1_214.onnx")
+SPOOF_IMGSZ = 224  # spoof checks run on face crops, so a small input size is enough
 CURRENT_STUDENT_JSON = "current_student.json"
 ATTENDANCE_RECORDS_JSON = 'attendance_records.json'
 STUDENT_DATA_JSON = 'student_data.json'
+CURRICULUM_JSON = 'curriculum.json'
 
 # Frame transfer control
 TRANSFER_EVERY_N_FRAMES = 5
+STREAM_JPEG_QUALITY = 65
+STREAM_MAX_FPS = 15  # cap on how often the preview frame is re-encoded
+STREAM_PREVIEW_WIDTH = 640  # wider frames are downscaled before the preview JPEG encode
+RUNNING_CHECK_INTERVAL = 0.25  # seconds between reads of shared_data['running']
 ATTENDANCE_DURATION = 300  #  in seconds (changed from 300)
 
+# Write-behind: staged JSON writes are flushed together after this delay
+# or as soon as this many writes are queued, whichever comes first
+FLUSH_INTERVAL = 0.5  # seconds
+FLUSH_BATCH_SIZE = 10
+
+# Face matching: max euclidean distance between encodings for a match
+MATCH_TOLERANCE = 0.65
+MATCH_TOLERANCE_SQ = MATCH_TOLERANCE ** 2
+FAISS_MIN_ENCODINGS = 100  # below this a plain NumPy scan is faster than an index
+# Fewer images than this are encoded in-process: starting spawned workers (each
+# re-imports the launching script, e.g. app.py) costs more than it saves
+TRAIN_PARALLEL_MIN_IMAGES = 32
+
+
+# -----------------------------
+# SECTION: JSON encode/decode helpers
+# (orjson when installed, stdlib json otherwise; both work on UTF-8 bytes)
+# -----------------------------
+
+def _json_default(obj):
+    # In-memory attendance rosters are sets; on disk they stay sorted lists
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _json_dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data, default=_json_default,
+                            option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False, indent=2, default=_json_default).encode('utf-8')
+
+
+# -----------------------------
+# SECTION: Parsed JSON cache
+# (keeps parsed files in memory until their mtime/size changes on disk)
+# -----------------------------
+
+_json_cache = {}
+
+
+def _file_stamp(path):
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+def _cached_load(path, build=None):
+    """Return parsed JSON for path (passed through build), re-reading only when the file changed"""
+    stamp = _file_stamp(path)
+    hit = _json_cache.get(path)
+    if hit is not None and hit[0] == stamp:
+        return hit[1]
+
+    with open(path, 'rb') as f:
+        data = _json_loads(f.read())
+    if build is not None:
+        data = build(data)
+    _json_cache[path] = (stamp, data)
+    return data
+
 
 # -----------------------------
 # SECTION: Attendance records I/O
@@ -36,9 +137,13 @@ ATTENDANCE_DURATION = 300  #  in seconds (changed from 300)
 # -----------------------------
 
 def load_attendance_records():
+    # Updates waiting for the flusher are the freshest copy
+    with _state_lock:
+        staged = _dirty.get(ATTENDANCE_RECORDS_JSON)
+        if staged is not None:
+            return staged[0]
     try:
-        with open(ATTENDANCE_RECORDS_JSON, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return _cached_load(ATTENDANCE_RECORDS_JSON)
     except FileNotFoundError:
         return {'records': {}}
     except Exception as e:
@@ -48,27 +153,75 @@ def load_attendance_records():
 
 def save_attendance_records(data):
     try:
-        atomic_write_json(ATTENDANCE_RECORDS_JSON, data)
+        _queue_write(ATTENDANCE_RECORDS_JSON, data, cache_value=data)
     except Exception as e:
         print(f"[ERROR] Failed to save {ATTENDANCE_RECORDS_JSON}: {e}")
 
 
+def _copy_lecture_record(rec):
+    copy = dict(rec)
+    for field in ('present', 'absent'):
+        roster = rec.get(field)
+        if roster is not None:
+            copy[field] = list(roster)
+    return copy
+
+
+def snapshot_attendance_records(key=None):
+    """Plain-list copy of the attendance records, safe to read without the lock.
+
+    With key ("YYYY-MM-DD_Lecture") only that record is copied. Only the
+    containers are copied while the lock is held; rosters are sorted after.
+    """
+    with _state_lock:
+        data = load_attendance_records()
+        records = data.get('records', {})
+        if key is not None:
+            records = {key: records[key]} if key in records else {}
+        snapshot = {k: v for k, v in data.items() if k != 'records'}
+        snapshot['records'] = {k: _copy_lecture_record(rec) for k, rec in records.items()}
+    for rec in snapshot['records'].values():
+        for field in ('present', 'absent'):
+            if field in rec:
+                rec[field].sort()
+    return snapshot
+
+
+def update_attendance_records(update):
+    """Run update(records) on the live records under the state lock and queue the save.
+
+    Rosters inside records are sets (see _lecture_rosters). Returns what update
+    returns; None means nothing changed and the save is skipped.
+    """
+    with _state_lock:
+        records = load_attendance_records()
+        result = update(records)
+        if result is not None:
+            save_attendance_records(records)
+    return result
+
+
 # -----------------------------
 # SECTION: Curriculum helpers
 # (functions that inspect curriculum.json to map subjects to years)
 # -----------------------------
 
+def _build_curriculum_index(curriculum):
+    """Map every subject in curriculum.json to its year"""
+    index = {}
+    for year, year_data in curriculum.items():
+        if not isinstance(year_data, dict):
+            continue
+        for sem_name, sem_data in year_data.get("Semesters", {}).items():
+            for subject in sem_data.get("Theory", []) + sem_data.get("Practicals", []):
+                index.setdefault(subject, year)
+    return index
+
+
 def get_subject_year(subject_name):
     """Find which year the given subject belongs to from curriculum.json"""
     try:
-        with open("curriculum.json", "r", encoding="utf-8") as f:
-            curriculum = json.load(f)
-
-        for year, year_data in curriculum.items():
-            for sem_name, sem_data in year_data.get("Semesters", {}).items():
-                all_subjects = sem_data.get("Theory", []) + sem_data.get("Practicals", [])
-                if subject_name in all_subjects:
-                    return year
+        return _cached_load(CURRICULUM_JSON, _build_curriculum_index).get(subject_name)
     except Exception as e:
         print(f"[ERROR] Could not determine year for subject '{subject_name}': {e}")
 
@@ -80,56 +233,79 @@ def get_subject_year(subject_name):
 # (load/save student_data.json and normalize batch/wrapper formats)
 # -----------------------------
 
+def _detect_student_format(data):
+    """Classify student_data.json as 'batch', 'wrapper' or 'flat' (None if unrecognised)"""
+    if not isinstance(data, dict):
+        return None
+
+    # Files hold one layout throughout, so the first dict entry is enough to tell
+    # (string values such as top-level comments are skipped)
+    first = next((v for v in data.values() if isinstance(v, dict) and v), None)
+
+    # Case 1: batch-style top-level keys mapping to student dicts
+    # e.g. { "2324": { "BSCIT-000": {...}, ... }, ... }
+    if first is not None:
+        inner = next(iter(first.values()))
+        if isinstance(inner, dict) and ('name' in inner or 'year' in inner):
+            return 'batch'
+
+    # Case 2: wrapper {'students': { ... }}
+    if isinstance(data.get('students'), dict):
+        return 'wrapper'
+
+    # Case 3: already flat mapping student_id -> info
+    if first is not None and ('name' in first or 'year' in first):
+        return 'flat'
+
+    return None
+
+
+def _build_student_store(data):
+    """Keep the raw file, its detected format and the flat student_id -> info view together"""
+    student_format = _detect_student_format(data)
+    all_students = {}
+
+    # Entries are copied so the raw structure stays exactly as it is on disk
+    if student_format == 'batch':
+        for batch_key, students in data.items():
+            if isinstance(students, dict):
+                for student_id, student_info in students.items():
+                    if isinstance(student_info, dict):
+                        info = dict(student_info)
+                        info.setdefault('batch', batch_key)
+                        info.setdefault('student_id', student_id)
+                        all_students[student_id] = info
+    elif student_format in ('wrapper', 'flat'):
+        students = data['students'] if student_format == 'wrapper' else data
+        for student_id, student_info in students.items():
+            if isinstance(student_info, dict):
+                info = dict(student_info)
+                info.setdefault('student_id', student_id)
+                all_students[student_id] = info
+
+    # year -> student ids, so per-subject rosters need no scan over every student
+    by_year = {}
+    for student_id, info in all_students.items():
+        by_year.setdefault(info.get('year'), set()).add(student_id)
+
+    return {'raw': data, 'format': student_format, 'students': all_students, 'by_year': by_year}
+
+
+def _load_student_store():
+    # A save still waiting for the flusher is newer than the file on disk
+    with _state_lock:
+        staged = _dirty.get(STUDENT_DATA_JSON)
+        if staged is not None:
+            return staged[1]
+    return _cached_load(STUDENT_DATA_JSON, _build_student_store)
+
+
 def load_student_data():
     """Load student data from JSON file - FIXED for batch structure"""
     try:
-        with open(STUDENT_DATA_JSON, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-
-            # Normalize into a flat mapping: student_id -> student_info
-            if isinstance(data, dict):
-                # Case 1: batch-style top-level keys mapping to student dicts
-                # e.g. { "2324": { "BSCIT-000": {...}, ... }, ... }
-                def looks_like_student_dict(d):
-                    if not isinstance(d, dict) or not d:
-                        return False
-                    first = next(iter(d.values()))
-                    return isinstance(first, dict) and ('name' in first or 'year' in first)
-
-                # detect batch-style
-                batch_like = any(looks_like_student_dict(v) for v in data.values())
-
-                if batch_like:
-                    all_students = {}
-                    for batch_key, students in data.items():
-                        if isinstance(students, dict):
-                            for student_id, student_info in students.items():
-                                if isinstance(student_info, dict):
-                                    student_info.setdefault('batch', batch_key)
-                                    student_info.setdefault('student_id', student_id)
-                                    all_students[student_id] = student_info
-                    return all_students
-
-                # Case 2: wrapper {'students': { ... }}
-                if 'students' in data and isinstance(data['students'], dict):
-                    all_students = {}
-                    for student_id, student_info in data['students'].items():
-                        if isinstance(student_info, dict):
-                            student_info.setdefault('student_id', student_id)
-                            all_students[student_id] = student_info
-                    return all_students
-
-                # Case 3: already flat mapping student_id -> info
-                if all(isinstance(v, dict) and ('name' in v or 'year' in v) for v in data.values()):
-                    all_students = {}
-                    for student_id, student_info in data.items():
-                        if isinstance(student_info, dict):
-                            student_info.setdefault('student_id', student_id)
-                            all_students[student_id] = student_info
-                    return all_students
-
-            # Fallback: return empty mapping
-            return {}
+        students = _load_student_store()['students']
+        # Hand out per-student copies so callers can edit them without touching the cache
+        return {student_id: dict(info) for student_id, info in students.items()}
     except FileNotFoundError:
         print(f"[WARN] {STUDENT_DATA_JSON} not found")
         return {}
@@ -138,116 +314,272 @@ def load_student_data():
         return {}
 
 
+def get_student_ids_for_year(year):
+    """Return the set of student ids enrolled in the given year (e.g. 'F.Y')"""
+    try:
+        return set(_load_student_store()['by_year'].get(year, ()))
+    except FileNotFoundError:
+        return set()
+    except Exception as e:
+        print(f"[ERROR] Failed to load {STUDENT_DATA_JSON}: {e}")
+        return set()
+
+
 def save_student_data(students_dict):
     try:
-        # Try to preserve the on-disk format. Read existing file to detect style.
-        existing = None
-        if os.path.exists(STUDENT_DATA_JSON):
+        with _state_lock:
+            # Preserve the on-disk format detected when the file was loaded
             try:
-                with open(STUDENT_DATA_JSON, 'r', encoding='utf-8') as f:
-                    existing = json.load(f)
+                store = _load_student_store()
             except Exception:
-                existing = None
-
-        # Helper to detect batch-style existing structure
-        def is_batch_style(d):
-            if not isinstance(d, dict) or not d:
-                return False
-            for v in d.values():
-                if isinstance(v, dict):
-                    first = next(iter(v.values())) if v else None
-                    if isinstance(first, dict) and ('name' in first or 'year' in first):
-                        return True
-            return False
-
-        if existing and is_batch_style(existing):
-            # Preserve batch keys. Merge/update entries into appropriate batches.
-            new_data = dict(existing)
-
-            # Ensure all batch keys are dicts
-            for k in list(new_data.keys()):
-                if not isinstance(new_data[k], dict):
-                    new_data[k] = {}
-
-            # Place each student into its batch (prefer explicit 'batch' in info)
-            for sid, sinfo in students_dict.items():
-                batch = sinfo.get('batch')
-                target = None
-                if batch and batch in new_data:
-                    target = batch
-                else:
-                    # try to find existing batch that already contains this sid
-                    for bkey, bval in new_data.items():
-                        if isinstance(bval, dict) and sid in bval:
-                            target = bkey
-                            break
-
-                if not target:
-                    # fallback: put into first batch key if exists, else create 'students'
-                    if len(new_data) > 0:
-                        target = next(iter(new_data.keys()))
+                store = None
+
+            if store and store['format'] == 'batch':
+                # Preserve batch keys. Merge/update entries into appropriate batches.
+                # Batch dicts are copied so the cached raw data is never edited in place.
+                new_data = {k: dict(v) if isinstance(v, dict) else {} for k, v in store['raw'].items()}
+
+                # Place each student into its batch (prefer explicit 'batch' in info)
+                for sid, sinfo in students_dict.items():
+                    batch = sinfo.get('batch')
+                    target = None
+                    if batch and batch in new_data:
+                        target = batch
                     else:
-                        target = 'students'
-                        new_data[target] = {}
-
-                # copy sinfo without transient keys
-                entry = {k: v for k, v in sinfo.items() if k not in ('batch', 'student_id')}
-                new_data.setdefault(target, {})[sid] = entry
+                        # try to find existing batch that already contains this sid
+                        for bkey, bval in new_data.items():
+                            if sid in bval:
+                                target = bkey
+                                break
+
+                    if not target:
+                        # fallback: put into first batch key if exists, else create 'students'
+                        if len(new_data) > 0:
+                            target = next(iter(new_data.keys()))
+                        else:
+                            target = 'students'
+                            new_data[target] = {}
 
-            atomic_write_json(STUDENT_DATA_JSON, new_data)
-            return
+                    # copy sinfo without transient keys
+                    entry = {k: v for k, v in sinfo.items() if k not in ('batch', 'student_id')}
+                    new_data.setdefault(target, {})[sid] = entry
+            else:
+                # Wrapper, flat or missing file: write as {'students': ...}
+                new_data = {'students': {sid: dict(sinfo) for sid, sinfo in students_dict.items()}}
 
-        # If existing is wrapper style {'students': {...}} or None, write as {'students': ...}
-        atomic_write_json(STUDENT_DATA_JSON, {'students': students_dict})
+            _queue_write(STUDENT_DATA_JSON, new_data, cache_value=_build_student_store(new_data))
     except Exception as e:
         print(f"[ERROR] Failed to save {STUDENT_DATA_JSON}: {e}")
 
 
 # -----------------------------
 # SECTION: Atomic file write helper
-# (safe write to JSON using a temporary file then move)
+# (safe write to JSON using a temporary file then rename)
 # -----------------------------
 
-def atomic_write_json(path, data):
+def _write_atomic(path, payload, durable=True):
+    # durable=False skips the fsync: the rename is still atomic, but a crash may lose
+    # the latest contents. Only for files that are regenerated anyway.
     dirpath = os.path.dirname(path) or "."
     os.makedirs(dirpath, exist_ok=True)
     fd, tmp_path = tempfile.mkstemp(dir=dirpath)
     try:
-        with os.fdopen(fd, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-            f.flush()
-            os.fsync(f.fileno())
-        shutil.move(tmp_path, path)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
     except Exception:
         if os.path.exists(tmp_path):
             os.remove(tmp_path)
         raise
 
 
+def atomic_write_json(path, data, durable=True):
+    # Staged writes reach disk first instead of being dropped, and the flusher is
+    # held off until this write lands, so older staged data cannot overwrite it
+    flush_pending_writes()
+    with _flush_lock:
+        _write_atomic(path, _json_dumps(data), durable)
+        with _state_lock:
+            _json_cache.pop(path, None)
+
+
+# -----------------------------
+# SECTION: Write-behind (group commit)
+# (stage JSON writes in memory; a background thread flushes them in batches)
+# -----------------------------
+
+_state_lock = threading.RLock()
+_flush_lock = threading.Lock()
+_pending_updates = queue.Queue()
+_dirty = {}  # path -> (data, cache_value, durable) waiting to be written
+_flusher_thread = None
+
+
+def _queue_write(path, data, cache_value=None, durable=True):
+    """Stage data as the new contents of path; the flusher writes it shortly.
+
+    cache_value, when given, primes the parsed-JSON cache after the write
+    so the next load does not have to re-read the file. durable is passed
+    on to _write_atomic.
+    """
+    global _flusher_thread
+    with _state_lock:
+        _dirty[path] = (data, cache_value, durable)
+        if _flusher_thread is None or not _flusher_thread.is_alive():
+            _flusher_thread = threading.Thread(target=_flush_loop, name="json-flusher", daemon=True)
+            _flusher_thread.start()
+    _pending_updates.put(path)
+
+
+def _flush_loop():
+    while True:
+        batch = [_pending_updates.get()]
+        deadline = time.monotonic() + FLUSH_INTERVAL
+        while len(batch) < FLUSH_BATCH_SIZE:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(_pending_updates.get(timeout=timeout))
+            except queue.Empty:
+                break
+        flush_pending_writes()
+
+
+def flush_pending_writes():
+    """Write every staged file now: one atomic write per file, one directory fsync per batch"""
+    with _flush_lock:
+        staged = []
+        with _state_lock:
+            for path, (data, cache_value, durable) in list(_dirty.items()):
+                try:
+                    staged.append((path, data, cache_value, durable, _json_dumps(data)))
+                except Exception as e:
+                    print(f"[ERROR] Failed to serialize {path}: {e}")
+            _dirty.clear()
+
+        dirpaths = set()
+        for path, data, cache_value, durable, payload in staged:
+            try:
+                _write_atomic(path, payload, durable)
+            except Exception as e:
+                print(f"[ERROR] Failed to write {path}: {e}")
+                with _state_lock:
+                    # Keep the data for the next flush unless something newer was staged
+                    _dirty.setdefault(path, (data, cache_value, durable))
+                continue
+            if durable:
+                dirpaths.add(os.path.dirname(path) or ".")
+            with _state_lock:
+                if cache_value is not None:
+                    _json_cache[path] = (_file_stamp(path), cache_value)
+                else:
+                    _json_cache.pop(path, None)
+
+        for dirpath in dirpaths:
+            try:
+                _fsync_dir(dirpath)
+            except OSError as e:
+                print(f"[WARN] Failed to fsync directory {dirpath}: {e}")
+
+
+atexit.register(flush_pending_writes)
+
+
 # -----------------------------
 # SECTION: Image helpers
-# (normalize images to RGB uint8 contiguous arrays)
+# (normalize images to RGB uint8 contiguous arrays; fix_image_format lives in face_encoding_worker)
 # -----------------------------
 
-def fix_image_format(img):
-    if img is None:
+def _fix_frame_bgr(dst_rgb, src_bgr):
+    """Camera-frame fast path: src is always uint8 BGR, so just convert into dst"""
+    return cv2.cvtColor(src_bgr, cv2.COLOR_BGR2RGB, dst=dst_rgb)
+
+
+def _preview_frame(frame_bgr, max_width=STREAM_PREVIEW_WIDTH):
+    """Downscale a frame for the browser preview; frames already small enough pass through"""
+    h, w = frame_bgr.shape[:2]
+    if w <= max_width:
+        return frame_bgr
+    return cv2.resize(frame_bgr, (max_width, int(h * max_width / w)), interpolation=cv2.INTER_AREA)
+
+
+def _encode_jpeg(frame_bgr, quality=STREAM_JPEG_QUALITY):
+    """JPEG-encode a BGR frame to bytes (TurboJPEG if available, else OpenCV); None on failure"""
+    if _tj is not None:
+        try:
+            return _tj.encode(frame_bgr, quality=quality, pixel_format=TJPF_BGR)
+        except Exception as e:
+            print(f"[WARN] TurboJPEG encode failed, using OpenCV: {e}")
+    ret, jpg_buf = cv2.imencode('.jpg', frame_bgr, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    return jpg_buf.tobytes() if ret else None
+
+
+# -----------------------------
+# SECTION: Face detection helpers
+# (OpenCV YuNet detector when its model is available, dlib HOG otherwise)
+# -----------------------------
+
+def load_face_detector(input_size):
+    """Create a YuNet detector for (width, height) input, or None to fall back to HOG"""
+    if not hasattr(cv2, 'FaceDetectorYN') or not os.path.exists(FACE_DETECTOR_MODEL):
         return None
-    if not isinstance(img, np.ndarray):
-        img = np.array(img)
-    if img.size == 0:
+    try:
+        return cv2.FaceDetectorYN.create(FACE_DETECTOR_MODEL, "", input_size, score_threshold=0.6)
+    except Exception as e:
+        print(f"[WARN] Could not load face detector {FACE_DETECTOR_MODEL}: {e}")
         return None
-    if len(img.shape) == 3:
-        if img.shape[2] == 4:
-            img = cv2.cvtColor(img, cv2.COLOR_RGBA2RGB)
-        elif img.shape[2] == 3:
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    elif len(img.shape) == 2:
-        img = cv2.cvtColor(img, cv2.COLOR_GRAY2RGB)
-    if img.dtype != np.uint8:
-        img = (img * 255).astype(np.uint8) if img.max() <= 1.0 else img.astype(np.uint8)
-    if not img.flags['C_CONTIGUOUS']:
-        img = np.ascontiguousarray(img)
-    return img
+
+
+def detect_face_locations(detector, img_bgr):
+    """Run YuNet on a BGR image and return (top, right, bottom, left) boxes like face_recognition"""
+    height, width = img_bgr.shape[:2]
+    detector.setInputSize((width, height))
+    _, faces = detector.detect(img_bgr)
+    if faces is None:
+        return []
+
+    locations = []
+    for x, y, w, h in faces[:, :4]:
+        left, top = max(0, int(x)), max(0, int(y))
+        right, bottom = min(width, int(x + w)), min(height, int(y + h))
+        if right > left and bottom > top:
+            locations.append((top, right, bottom, left))
+    return locations
+
+
+# -----------------------------
+# SECTION: Face matching helpers
+# (known encodings as one float32 matrix, nearest match via squared distance)
+# -----------------------------
+
+def _build_encode_matrix(encodings):
+    """Stack known encodings into a contiguous (N, 128) float32 matrix (no copy if already one)"""
+    return np.ascontiguousarray(np.asarray(encodings, dtype=np.float32).reshape(-1, 128))
+
+
+def _build_match_index(encode_matrix):
+    """Exact FAISS L2 index over the known encodings for large classes, else None"""
+    if faiss is None or len(encode_matrix) < FAISS_MIN_ENCODINGS:
+        return None
+    index = faiss.IndexFlatL2(encode_matrix.shape[1])
+    index.add(encode_matrix)
+    return index
+
+
+def _best_match(encode_matrix, encode_face, index=None):
+    """Return (index, squared distance) of the closest known encoding"""
+    if index is not None:
+        # IndexFlatL2 reports squared L2 distances, same as the NumPy path
+        sq_dists, ids = index.search(encode_face.astype(np.float32).reshape(1, -1), 1)
+        return int(ids[0, 0]), float(sq_dists[0, 0])
+    diff = encode_matrix - encode_face.astype(np.float32)
+    sq_dists = np.einsum('ij,ij->i', diff, diff)
+    match_index = int(np.argmin(sq_dists))
+    return match_index, float(sq_dists[match_index])
 
 
 # -----------------------------
@@ -255,63 +587,89 @@ def fix_image_format(img):
 # (update attendance records and student totals in JSON storage)
 # -----------------------------
 
-def update_attendance_in_database(student_id, student_name, lecture, status='Present'):
-    """Update attendance using JSON storage"""
-    today = datetime.now().strftime("%Y-%m-%d")
-    current_time = datetime.now().strftime("%H:%M:%S")
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+def _lecture_rosters(rec):
+    """Return the (present, absent) sets of a lecture record, converting stored lists in place"""
+    # Rosters are kept as sets in memory; _json_dumps writes them back as sorted lists
+    present = rec.get('present')
+    if not isinstance(present, set):
+        present = rec['present'] = set(present or ())
+    absent = rec.get('absent')
+    if not isinstance(absent, set):
+        absent = rec['absent'] = set(absent or ())
+    return present, absent
 
-    try:
-        records = load_attendance_records()
-        key = f"{today}_{lecture}"
-        rec = records.get('records', {}).get(key, {'present': [], 'absent': [], 'time': current_time})
 
-        was_present = student_id in rec.get('present', [])
-        was_absent = student_id in rec.get('absent', [])
+def mark_lecture_present(student_id, lecture, now=None):
+    """Add student_id to today's present roster for lecture (locked read-modify-save).
 
-        if status == 'Present':
-            if student_id not in rec['present']:
-                rec['present'].append(student_id)
-            if student_id in rec['absent']:
-                try:
-                    rec['absent'].remove(student_id)
-                except ValueError:
-                    pass
-        else:
-            if student_id not in rec['absent']:
-                rec['absent'].append(student_id)
-            if student_id in rec['present']:
-                try:
-                    rec['present'].remove(student_id)
-                except ValueError:
-                    pass
+    Returns True if the student was newly marked, False if already present.
+    Used by the camera loop and the mobile routes alike.
+    """
+    now = now or datetime.now()
+    today = now.strftime("%Y-%m-%d")
+    current_time = now.strftime("%H:%M:%S")
 
+    with _state_lock:
+        records = load_attendance_records()
+        rec = records.setdefault('records', {}).setdefault(f"{today}_{lecture}", {'time': current_time})
+        present, absent = _lecture_rosters(rec)
+        if student_id in present:
+            return False
+        present.add(student_id)
+        absent.discard(student_id)
         rec['time'] = current_time
-        if 'records' not in records:
-            records['records'] = {}
-        records['records'][key] = rec
         save_attendance_records(records)
+    return True
 
-        students = load_student_data()
-        s = students.get(student_id, {})
-        prev_total = int(s.get('total_attendance', 0)) if s.get('total_attendance') is not None else 0
 
-        if status == 'Present' and not was_present:
-            s['total_attendance'] = prev_total + 1
-            s['last_attendance_time'] = timestamp
-        elif status != 'Present' and 'total_attendance' not in s:
-            s['total_attendance'] = prev_total
+def update_attendance_in_database(student_id, student_name, lecture, status='Present'):
+    """Update attendance using JSON storage"""
+    now = datetime.now()
+    today = now.strftime("%Y-%m-%d")
+    current_time = now.strftime("%H:%M:%S")
+    timestamp = f"{today} {current_time}"
 
-        if student_id in students:
-            students[student_id].update(s)
-        else:
-            students[student_id] = {
-                'student_id': student_id,
-                'name': student_name,
-                'total_attendance': s.get('total_attendance', prev_total),
-                'last_attendance_time': s.get('last_attendance_time', '')
-            }
-        save_student_data(students)
+    try:
+        # Read-modify-write of the shared in-memory records must not interleave
+        with _state_lock:
+            if status == 'Present':
+                was_present = not mark_lecture_present(student_id, lecture, now)
+            else:
+                records = load_attendance_records()
+                key = f"{today}_{lecture}"
+                rec = records.get('records', {}).get(key, {'time': current_time})
+                present, absent = _lecture_rosters(rec)
+
+                was_present = student_id in present
+                absent.add(student_id)
+                present.discard(student_id)
+
+                rec['time'] = current_time
+                if 'records' not in records:
+                    records['records'] = {}
+                records['records'][key] = rec
+                save_attendance_records(records)
+
+            students = load_student_data()
+            s = students.get(student_id, {})
+            prev_total = int(s.get('total_attendance', 0)) if s.get('total_attendance') is not None else 0
+
+            if status == 'Present' and not was_present:
+                s['total_attendance'] = prev_total + 1
+                s['last_attendance_time'] = timestamp
+            elif status != 'Present' and 'total_attendance' not in s:
+                s['total_attendance'] = prev_total
+
+            if student_id in students:
+                students[student_id].update(s)
+            else:
+                students[student_id] = {
+                    'student_id': student_id,
+                    'name': student_name,
+                    'total_attendance': s.get('total_attendance', prev_total),
+                    'last_attendance_time': s.get('last_attendance_time', '')
+                }
+            save_student_data(students)
 
         return True
 
@@ -320,6 +678,58 @@ def update_attendance_in_database(student_id, student_name, lecture, status='Pre
         return False
 
 
+def bulk_mark_absent(student_ids, lecture, init_totals=True):
+    """Mark many students absent with one records update (and at most one student-data save).
+
+    Students already present for the lecture are left alone, and an existing
+    record keeps its time (that of its first scan). init_totals=False leaves
+    student_data.json untouched. Returns the ids newly marked absent.
+    """
+    now = datetime.now()
+    today = now.strftime("%Y-%m-%d")
+    current_time = now.strftime("%H:%M:%S")
+    ids = set(student_ids)
+    if not ids:
+        return set()
+
+    try:
+        with _state_lock:
+            records = load_attendance_records()
+            key = f"{today}_{lecture}"
+            rec = records.get('records', {}).get(key, {'time': current_time})
+            present, absent = _lecture_rosters(rec)
+            # Checked under the lock: a scan that lands just before this still counts
+            ids -= present
+            marked = ids - absent
+            absent |= ids
+
+            if 'records' not in records:
+                records['records'] = {}
+            records['records'][key] = rec
+            save_attendance_records(records)
+
+            if not init_totals:
+                return marked
+
+            # Same bookkeeping as update_attendance_in_database for an absence:
+            # totals are only initialised, never incremented
+            students = load_student_data()
+            changed = False
+            for student_id in ids:
+                s = students.get(student_id)
+                if s is not None and 'total_attendance' not in s:
+                    s['total_attendance'] = 0
+                    changed = True
+            if changed:
+                save_student_data(students)
+
+        return marked
+
+    except Exception as e:
+        print(f"[ERROR] Failed to bulk mark absent for {lecture}: {e}")
+        return set()
+
+
 def mark_all_students_absent(lecture):
     """
     DEPRECATED - This function is no longer used in the new logic.
@@ -329,11 +739,18 @@ def mark_all_students_absent(lecture):
     return False
 
 
+def get_current_teacher():
+    """Parsed current_teacher.json (cached, treat as read-only), or {} if missing or invalid"""
+    try:
+        info = _cached_load("current_teacher.json")
+        return info if isinstance(info, dict) else {}
+    except Exception:
+        return {}
+
+
 def get_current_lecture():
     try:
-        with open("current_teacher.json", "r", encoding='utf-8') as f:
-            teacher_data = json.load(f)
-            return teacher_data.get('lecture', 'Default')
+        return _cached_load("current_teacher.json").get('lecture', 'Default')
     except:
         return 'Default'
 
@@ -378,7 +795,8 @@ def save_student_info_to_json(info, teacher_info=None):
             'lecture': teacher_info.get('lecture', '') if teacher_info else ''
         }
         
-        atomic_write_json(CURRENT_STUDENT_JSON, data)
+        # Only polled by the UI and rewritten on every recognition: batched, no fsync
+        _queue_write(CURRENT_STUDENT_JSON, data, durable=False)
         print(f"[SUCCESS] Saved current_student.json → {student_id}.png")
         
     except Exception as e:
@@ -404,11 +822,40 @@ def mark_present(student_id, lecture, marked_by="system"):
         return False
 
 
+def _evict_expired(last_seen, now, window):
+    """Drop entries older than window from an OrderedDict kept in last-seen order"""
+    while last_seen:
+        student_id, seen_at = next(iter(last_seen.items()))
+        if now - seen_at < window:
+            break
+        last_seen.popitem(last=False)
+
+
+def _face_roi(frame, face_locations, scale=4, margin=0.25):
+    """Crop frame around all faces; locations are (top, right, bottom, left) at 1/scale size"""
+    if not face_locations:
+        return None
+    top = min(loc[0] for loc in face_locations) * scale
+    right = max(loc[1] for loc in face_locations) * scale
+    bottom = max(loc[2] for loc in face_locations) * scale
+    left = min(loc[3] for loc in face_locations) * scale
+
+    # Keep some context around the face: the spoof model also looks at screen/paper edges
+    pad_y = int((bottom - top) * margin)
+    pad_x = int((right - left) * margin)
+    height, width = frame.shape[:2]
+    top, bottom = max(0, top - pad_y), min(height, bottom + pad_y)
+    left, right = max(0, left - pad_x), min(width, right + pad_x)
+    if bottom <= top or right <= left:
+        return None
+    return frame[top:bottom, left:right]
+
+
 def detect_spoofing(img, model, threshold, classNames):
     if model is None:
         return True
     try:
-        results = model(img, stream=True, verbose=False)
+        results = model(img, stream=True, verbose=False, imgsz=SPOOF_IMGSZ)
         max_real_conf = 0.0
         max_fake_conf = 0.0
         
@@ -441,40 +888,123 @@ def detect_spoofing(img, model, threshold, classNames):
 
 def train_encodings():
     """Train face encodings from student images"""
-    imgList = []
+    paths = []
     studentIds = []
 
     if not os.path.exists(STUDENT_IMAGES_FOLDER):
         print(f"[WARN] Student images folder not found: {STUDENT_IMAGES_FOLDER}")
         return
 
-    for filename in os.listdir(STUDENT_IMAGES_FOLDER):
-        if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-            path = os.path.join(STUDENT_IMAGES_FOLDER, filename)
-            img = cv2.imread(path)
-            if img is not None:
-                imgList.append(img)
-                studentIds.append(os.path.splitext(filename)[0])
+    # DirEntry carries the file type from the directory read, no extra stat per image
+    with os.scandir(STUDENT_IMAGES_FOLDER) as it:
+        for entry in it:
+            if entry.is_file() and entry.name.lower().endswith(('.png', '.jpg', '.jpeg')):
+                paths.append(entry.path)
+                studentIds.append(os.path.splitext(entry.name)[0])
 
-    if not imgList:
+    if not paths:
         print("[WARN] No student images found for training")
         return
 
+    workers = min(len(paths), os.cpu_count() or 1)
+    if workers < 2 or len(paths) < TRAIN_PARALLEL_MIN_IMAGES:
+        results = [encode_image_file(path) for path in paths]
+    else:
+        # Each image is independent, so spread the dlib work over all cores.
+        # Workers are spawned, not forked: this runs inside the threaded Flask process
+        # and a forked child could inherit a lock held by another thread.
+        with ProcessPoolExecutor(max_workers=workers,
+                                 mp_context=multiprocessing.get_context("spawn")) as ex:
+            results = list(ex.map(encode_image_file, paths, chunksize=4))
+
     encodeList = []
-    for i, img in enumerate(imgList):
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        encodes = face_recognition.face_encodings(img_rgb)
-        if encodes:
-            encodeList.append(encodes[0])
-            print(f"[INFO] Encoded face {i + 1}/{len(imgList)}: {studentIds[i]}")
+    validIds = []
+    for i, (student_id, encoding) in enumerate(zip(studentIds, results)):
+        if encoding is not None:
+            encodeList.append(encoding)
+            validIds.append(student_id)
+            print(f"[INFO] Encoded face {i + 1}/{len(paths)}: {student_id}")
         else:
-            print(f"[WARN] No face found in image: {studentIds[i]}")
+            print(f"[WARN] No face found in image: {student_id}")
 
+    # Stored as one float32 matrix: half the size of float64 and loads without restacking
+    encodeMatrix = _build_encode_matrix(encodeList)
     with open(ENCODE_FILE, "wb") as f:
-        pickle.dump([encodeList, studentIds], f)
+        pickle.dump([encodeMatrix, validIds], f, protocol=pickle.HIGHEST_PROTOCOL)
+    try:
+        save_encodings_npy(encodeMatrix, validIds)
+    except Exception as e:
+        # load_encodings_npy sees the stale stamp and regenerates the copy from the pickle
+        print(f"[WARN] Could not write {ENCODE_MATRIX_FILE}: {e}")
     print(f"[SUCCESS] Encoded {len(encodeList)} faces and saved to {ENCODE_FILE}")
 
 
+# -----------------------------
+# SECTION: Pickle-free encodings store
+# (EncodeFile.npy + EncodeFile.ids.json, kept in step with EncodeFile.p)
+# -----------------------------
+
+def save_encodings_npy(encode_matrix, student_ids):
+    """Write the .npy/.json copy of the encodings, tagged with the current EncodeFile.p stamp"""
+    try:
+        source = list(_file_stamp(ENCODE_FILE))
+    except FileNotFoundError:
+        source = None
+    buf = io.BytesIO()
+    np.save(buf, _build_encode_matrix(encode_matrix), allow_pickle=False)
+    _write_atomic(ENCODE_MATRIX_FILE, buf.getvalue())
+    _write_atomic(ENCODE_IDS_FILE, _json_dumps({'source': source, 'ids': list(student_ids)}))
+
+
+def load_encodings_npy():
+    """Return (encode_matrix, student_ids) without unpickling.
+
+    On POSIX the matrix is a read-only memory map of EncodeFile.npy;
+    save_encodings_npy replaces the file rather than rewriting it, so existing
+    maps stay valid. Windows cannot replace a mapped file, so there the matrix
+    is a private in-memory copy.
+
+    When the .npy/.json pair is missing or was made from an older EncodeFile.p
+    (e.g. train_images.py retrained), it is regenerated from the pickle once.
+    """
+    try:
+        source = list(_file_stamp(ENCODE_FILE))
+    except FileNotFoundError:
+        source = None
+
+    try:
+        with open(ENCODE_IDS_FILE, 'rb') as f:
+            meta = _json_loads(f.read())
+        if source is None or meta.get('source') == source:
+            encode_matrix = None
+            if os.name != 'nt':
+                try:
+                    # Read-only map: pages come from the OS cache and are shared by
+                    # every process using the encodings instead of copied into each
+                    encode_matrix = np.load(ENCODE_MATRIX_FILE, mmap_mode='r', allow_pickle=False)
+                except ValueError:
+                    # An empty matrix cannot be mapped
+                    pass
+            if encode_matrix is None:
+                encode_matrix = np.load(ENCODE_MATRIX_FILE, allow_pickle=False)
+            student_ids = meta.get('ids', [])
+            if len(encode_matrix) == len(student_ids):
+                return encode_matrix, student_ids
+    except FileNotFoundError:
+        pass
+
+    # Missing or stale: migrate from the pickle
+    with open(ENCODE_FILE, "rb") as f:
+        encode_list, student_ids = pickle.load(f)
+    encode_matrix = _build_encode_matrix(encode_list)
+    try:
+        save_encodings_npy(encode_matrix, student_ids)
+        print(f"[INFO] Wrote {ENCODE_MATRIX_FILE} from {ENCODE_FILE}")
+    except Exception as e:
+        print(f"[WARN] Could not write {ENCODE_MATRIX_FILE}: {e}")
+    return encode_matrix, list(student_ids)
+
+
 # -----------------------------
 # SECTION: Main attendance runtime loop
 # (camera capture, spoof detection, recognition, marking logic)
@@ -483,6 +1013,7 @@ def train_encodings():
 def main(shared_data):
     print("[INFO] Attendance system started with 1-HOUR attendance logic.")
     frame_counter = 0
+    last_broadcast = 0.0
 
     # Initialize camera
     cap = cv2.VideoCapture(0)
@@ -502,9 +1033,12 @@ def main(shared_data):
         train_encodings()
 
     try:
-        with open(ENCODE_FILE, "rb") as f:
-            encodeListKnown, studentIds = pickle.load(f)
+        encodeListKnown, studentIds = load_encodings_npy()
+        encodeMatrix = _build_encode_matrix(encodeListKnown)
+        matchIndex = _build_match_index(encodeMatrix)
         print(f"[INFO] Loaded {len(studentIds)} encoded faces: {studentIds}")
+        if matchIndex is not None:
+            print("[INFO] Using FAISS index for face matching")
     except Exception as e:
         print(f"[ERROR] Failed loading EncodeFile.p: {e}")
         shared_data['running'] = False
@@ -513,7 +1047,10 @@ def main(shared_data):
 
     # Load spoof detection model
     try:
-        spoofModel = YOLO("models/l_version_1_214.pt") if YOLO is not None else None
+        spoofModel = None
+        if YOLO is not None:
+            # Prefer the ONNX export (runs on onnxruntime) when it has been generated
+            spoofModel = YOLO(SPOOF_MODEL_ONNX if os.path.exists(SPOOF_MODEL_ONNX) else SPOOF_MODEL)
         if spoofModel:
             print("[INFO] Spoof detection model loaded")
     except Exception as e:
@@ -522,10 +1059,15 @@ def main(shared_data):
 
     classNames = ["fake", "real"]
 
+    # Face detector for the quarter-size frames (input size is updated per frame)
+    faceDetector = load_face_detector((160, 120))
+    if faceDetector is not None:
+        print("[INFO] YuNet face detector loaded")
+
     # Load teacher info
     try:
-        with open("current_teacher.json", "r", encoding='utf-8') as f:
-            teacher_info = json.load(f)
+        with open("current_teacher.json", "rb") as f:
+            teacher_info = _json_loads(f.read())
         print(f"[INFO] Loaded teacher info: {teacher_info.get('name')} - {teacher_info.get('lecture')}")
     except Exception as e:
         print(f"[WARN] Could not load teacher info: {e}")
@@ -541,25 +1083,75 @@ def main(shared_data):
     shared_data['absence_marked'] = False
 
     # Start 1-hour timer and initialize recognition state
+    # (monotonic clock, so NTP/wall-clock adjustments cannot shorten or extend the session)
     attendance_active = True
-    start_time = time.time()
+    start_time = time.monotonic()
     recognition_cooldown = 8  # seconds between recognizing the same student
-    recently_recognized = {}
+    recently_recognized = OrderedDict()  # student_id -> last seen, oldest first
+
+    # Per-frame work buffers, allocated once and reused (resized only if the camera resolution changes)
+    display_buf = small_buf = rgb_buf = None
+    # Faces from the last detection pass; the spoof check only looks at that region
+    last_face_locations = []
+
+    # Camera reads run on their own thread and only the newest frame is kept,
+    # so recognition work never waits on cap.read()
+    latest_frame = [None, 0]  # [frame, sequence number]
+    frame_lock = threading.Lock()
+    frame_ready = threading.Event()
+    stop_capture = threading.Event()
+
+    def capture_frames():
+        while not stop_capture.is_set() and cap.isOpened():
+            ok, captured = cap.read()
+            if not ok or captured is None:
+                time.sleep(0.01)
+                continue
+            with frame_lock:
+                latest_frame[0] = captured
+                latest_frame[1] += 1
+            frame_ready.set()
+
+    capture_thread = threading.Thread(target=capture_frames, name="camera-capture", daemon=True)
+    capture_thread.start()
+    last_frame_seq = 0
+    # shared_data is a Manager proxy (one IPC round-trip per read), so the
+    # stop flag is checked a few times a second rather than on every pass
+    running = True
+    next_running_check = 0.0
 
     try:
-        while shared_data.get('running', True) and cap.isOpened():
-            success, frame = cap.read()
-            if not success or frame is None:
-                time.sleep(0.01)
+        while cap.isOpened():
+            now_mono = time.monotonic()
+            if now_mono >= next_running_check:
+                running = shared_data.get('running', True)
+                next_running_check = now_mono + RUNNING_CHECK_INTERVAL
+            if not running:
+                break
+
+            # Sleep until the capture thread stores a frame (timeout bounds the stop-flag latency)
+            if not frame_ready.wait(timeout=RUNNING_CHECK_INTERVAL):
+                continue
+            frame_ready.clear()
+            with frame_lock:
+                frame, frame_seq = latest_frame
+            if frame is None or frame_seq == last_frame_seq:
                 continue
+            last_frame_seq = frame_seq
 
             frame_counter += 1
 
-            elapsed_time = time.time() - start_time
+            elapsed_time = time.monotonic() - start_time
             attendance_active = elapsed_time < ATTENDANCE_DURATION
 
             should_transfer_frame = False
-            display_frame = frame.copy()
+            if display_buf is None or display_buf.shape != frame.shape:
+                height, width = frame.shape[:2]
+                display_buf = np.empty_like(frame)
+                small_buf = np.empty((height // 4, width // 4, 3), dtype=np.uint8)
+                rgb_buf = np.empty_like(small_buf)
+            np.copyto(display_buf, frame)
+            display_frame = display_buf
 
             # Show timer on screen
             remaining_time = max(0, ATTENDANCE_DURATION - elapsed_time)
@@ -578,12 +1170,15 @@ def main(shared_data):
             if attendance_active and frame_counter % 2 == 0:
                 is_real = True
 
-                # Spoof detection (less frequent)
+                # Spoof detection (less frequent, only on the crop around known faces)
+                spoof_roi = None
                 if spoofModel is not None and frame_counter % 6 == 0:
+                    spoof_roi = _face_roi(frame, last_face_locations)
+                if spoof_roi is not None:
                     try:
-                        is_real = detect_spoofing(frame, spoofModel, 0.5, classNames)
+                        is_real = detect_spoofing(spoof_roi, spoofModel, 0.5, classNames)
 
-                        current_time = time.time()
+                        current_time = time.monotonic()
                         if 'last_spoof_check' not in shared_data:
                             shared_data['last_spoof_check'] = current_time
                             shared_data['recent_spoof_results'] = []
@@ -608,131 +1203,137 @@ def main(shared_data):
 
                 # Face detection and recognition
                 if is_real:
-                    small_frame = cv2.resize(frame, (0, 0), fx=0.25, fy=0.25)
-                    small_frame = fix_image_format(small_frame)
+                    cv2.resize(frame, (small_buf.shape[1], small_buf.shape[0]),
+                               dst=small_buf, interpolation=cv2.INTER_AREA)
+                    small_frame = _fix_frame_bgr(rgb_buf, small_buf)
 
-                    if small_frame is not None:
+                    if faceDetector is not None:
+                        face_locations = detect_face_locations(faceDetector, small_buf)
+                    else:
                         face_locations = face_recognition.face_locations(small_frame, model="hog")
-
-                        if len(face_locations) > 0:
-                            should_transfer_frame = True
-
-                            face_encodings = face_recognition.face_encodings(small_frame, face_locations)
-
-                            for (top, right, bottom, left), encode_face in zip(face_locations, face_encodings):
-                                if len(encodeListKnown) == 0:
+                    last_face_locations = face_locations
+
+                    if len(face_locations) > 0:
+                        should_transfer_frame = True
+
+                        face_encodings = face_recognition.face_encodings(small_frame, face_locations)
+
+                        for (top, right, bottom, left), encode_face in zip(face_locations, face_encodings):
+                            if len(encodeMatrix) == 0:
+                                continue
+
+                            match_index, sq_distance = _best_match(encodeMatrix, encode_face, matchIndex)
+                            distance = sq_distance ** 0.5
+                            candidate_id = studentIds[match_index] if match_index < len(studentIds) else None
+                            if logger.isEnabledFor(logging.DEBUG):
+                                logger.debug("Best candidate: idx=%d, id=%s, distance=%.3f",
+                                             match_index, candidate_id, distance)
+
+                            # Accept match if within tolerance
+                            if sq_distance <= MATCH_TOLERANCE_SQ:
+                                student_id = candidate_id
+                            else:
+                                # Draw unknown and continue
+                                t, r, b, l = top * 4, right * 4, bottom * 4, left * 4
+                                cv2.rectangle(display_frame, (l, t), (r, b), (0, 165, 255), 2)
+                                cv2.putText(display_frame, f"Unknown ({distance:.2f})", (l, t - 10),
+                                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 165, 255), 2)
+                                logger.debug("No match within tolerance: min_distance=%.3f, tol=%s",
+                                             distance, MATCH_TOLERANCE)
+                                continue
+
+                            current_time = time.monotonic()
+
+                            # Check cooldown
+                            if student_id in recently_recognized and current_time - recently_recognized[student_id] < recognition_cooldown:
+                                t, r, b, l = top * 4, right * 4, bottom * 4, left * 4
+                                student_info = get_student_info_from_database(student_id) or {}
+                                student_name = student_info.get('name', 'Unknown')
+                                cv2.rectangle(display_frame, (l, t), (r, b), (0, 200, 0), 2)
+                                cv2.putText(display_frame, f"{student_name} (Already marked)",
+                                            (l, t - 10),
+                                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 200, 0), 2)
+                                continue
+
+                            recently_recognized[student_id] = current_time
+                            recently_recognized.move_to_end(student_id)
+                            if len(recently_recognized) > 256:
+                                # Bound the cooldown map in very busy sessions
+                                _evict_expired(recently_recognized, current_time, recognition_cooldown)
+
+                            try:
+                                student_info = get_student_info_from_database(student_id)
+                                if not student_info:
+                                    print(f"[WARN] Student ID {student_id} not found in database")
                                     continue
 
-                                face_distances = face_recognition.face_distance(encodeListKnown, encode_face)
-                                if len(face_distances) == 0:
-                                    continue
+                                print(f"[INFO] Recognized student: {student_id} - {student_info.get('name')}")
 
-                                match_index = int(np.argmin(face_distances))
-                                distance = float(face_distances[match_index])
-                                candidate_id = studentIds[match_index] if match_index < len(studentIds) else None
-                                print(f"[DEBUG] Best candidate: idx={match_index}, id={candidate_id}, distance={distance:.3f}")
+                                current_lecture = get_current_lecture()
+                                current_teacher = {
+                                    'username': teacher_info.get('username', ''),
+                                    'name': teacher_info.get('name', ''),
+                                    'lecture': current_lecture
+                                }
 
-                                # Accept match if within tolerance
-                                if distance <= 0.65:
-                                    student_id = candidate_id
-                                else:
-                                    # Draw unknown and continue
-                                    t, r, b, l = top * 4, right * 4, bottom * 4, left * 4
-                                    cv2.rectangle(display_frame, (l, t), (r, b), (0, 165, 255), 2)
-                                    cv2.putText(display_frame, f"Unknown ({distance:.2f})", (l, t - 10),
-                                                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 165, 255), 2)
-                                    print(f"[DEBUG] No match within tolerance: min_distance={distance:.3f}, tol=0.65")
-                                    continue
+                                teacher_subject = current_lecture
+                                subject_year = get_subject_year(teacher_subject)
 
-                                current_time = time.time()
-
-                                # Check cooldown
-                                if student_id in recently_recognized and current_time - recently_recognized[student_id] < recognition_cooldown:
-                                    t, r, b, l = top * 4, right * 4, bottom * 4, left * 4
-                                    student_info = get_student_info_from_database(student_id) or {}
-                                    student_name = student_info.get('name', 'Unknown')
-                                    cv2.rectangle(display_frame, (l, t), (r, b), (0, 200, 0), 2)
-                                    cv2.putText(display_frame, f"{student_name} (Already marked)",
-                                                (l, t - 10),
-                                                cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 200, 0), 2)
+                                if not subject_year:
+                                    print(f"[WARN] Could not find year for subject {teacher_subject}")
                                     continue
 
-                                recently_recognized[student_id] = current_time
-
-                                try:
-                                    student_info = get_student_info_from_database(student_id)
-                                    if not student_info:
-                                        print(f"[WARN] Student ID {student_id} not found in database")
-                                        continue
-
-                                    print(f"[INFO] Recognized student: {student_id} - {student_info.get('name')}")
-
-                                    # Save current student info immediately
-                                    current_lecture = get_current_lecture()
-                                    current_teacher = {
-                                        'username': teacher_info.get('username', ''),
-                                        'name': teacher_info.get('name', ''),
-                                        'lecture': current_lecture
-                                    }
-                                    try:
-                                        save_student_info_to_json(student_info, current_teacher)
-                                    except Exception:
-                                        print(f"[WARN] Failed to write current_student.json for {student_id}")
-
-                                    teacher_subject = current_lecture
-                                    subject_year = get_subject_year(teacher_subject)
-
-                                    if not subject_year:
-                                        print(f"[WARN] Could not find year for subject {teacher_subject}")
-                                        continue
-
-                                    success = False
-                                    if student_info.get("year") == subject_year:
-                                        success = mark_present(student_id, teacher_subject, teacher_info.get('username', ''))
-                                        if success:
-                                            print(f"[INFO] ✅ Marked {student_id} ({student_info.get('name')}) present for {teacher_subject}")
-                                    else:
-                                        print(f"[SKIP] {student_id} ({student_info.get('name')}) is in {student_info.get('year')} not {subject_year}")
-
+                                success = False
+                                if student_info.get("year") == subject_year:
+                                    success = mark_present(student_id, teacher_subject, teacher_info.get('username', ''))
                                     if success:
-                                        save_student_info_to_json(student_info, current_teacher)
-
-                                    # Draw rectangle on face
-                                    t, r, b, l = top * 4, right * 4, bottom * 4, left * 4
+                                        print(f"[INFO] ✅ Marked {student_id} ({student_info.get('name')}) present for {teacher_subject}")
+                                else:
+                                    print(f"[SKIP] {student_id} ({student_info.get('name')}) is in {student_info.get('year')} not {subject_year}")
+
+                                # current_student.json is written once, after the mark (with the updated total)
+                                if success:
+                                    save_student_info_to_json(student_info, current_teacher)
+
+                                # Draw rectangle on face
+                                t, r, b, l = top * 4, right * 4, bottom * 4, left * 4
+
+                                if success:
+                                    cv2.rectangle(display_frame, (l, t), (r, b), (0, 200, 0), 3, cv2.LINE_AA)
+                                    cv2.rectangle(display_frame, (l + 4, t + 4), (r - 4, b - 4), (0, 255, 0), 2, cv2.LINE_AA)
+                                    cv2.putText(display_frame, f"Present: {student_info.get('name')}",
+                                                (l, t - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+                                    cv2.putText(display_frame, f"ID: {student_id}",
+                                                (l, t - 30), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+                                else:
+                                    cv2.rectangle(display_frame, (l, t), (r, b), (0, 255, 255), 2, cv2.LINE_AA)
+                                    cv2.putText(display_frame, f"Recog: {student_info.get('name')}",
+                                                (l, t - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
 
-                                    if success:
-                                        cv2.rectangle(display_frame, (l, t), (r, b), (0, 200, 0), 3, cv2.LINE_AA)
-                                        cv2.rectangle(display_frame, (l + 4, t + 4), (r - 4, b - 4), (0, 255, 0), 2, cv2.LINE_AA)
-                                        cv2.putText(display_frame, f"Present: {student_info.get('name')}",
-                                                    (l, t - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-                                        cv2.putText(display_frame, f"ID: {student_id}",
-                                                    (l, t - 30), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
-                                    else:
-                                        cv2.rectangle(display_frame, (l, t), (r, b), (0, 255, 255), 2, cv2.LINE_AA)
-                                        cv2.putText(display_frame, f"Recog: {student_info.get('name')}",
-                                                    (l, t - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
-
-                                except Exception as e:
-                                    print(f"[ERROR] Operation failed for {student_id}: {e}")
-                                    import traceback
-                                    traceback.print_exc()
+                            except Exception as e:
+                                print(f"[ERROR] Operation failed for {student_id}: {e}")
+                                import traceback
+                                traceback.print_exc()
 
             # Periodic transfer
             if frame_counter % TRANSFER_EVERY_N_FRAMES == 0:
                 should_transfer_frame = True
 
-            # Only encode and transfer if needed
+            # Only encode and transfer if needed: someone is watching /video_feed
+            # (no counter means an older launcher, so keep streaming) and the fps cap allows it
             if should_transfer_frame:
-                ret, jpg_buf = cv2.imencode('.jpg', display_frame, [int(cv2.IMWRITE_JPEG_QUALITY), 65])
-                if ret:
-                    shared_data['frame_jpeg'] = jpg_buf.tobytes()
-                    shared_data['frame_updated'] = time.time()
+                now_mono = time.monotonic()
+                if (now_mono - last_broadcast >= 1.0 / STREAM_MAX_FPS
+                        and shared_data.get('viewer_count', 1) > 0):
+                    last_broadcast = now_mono
+                    jpg_bytes = _encode_jpeg(_preview_frame(display_frame))
+                    if jpg_bytes is not None:
+                        shared_data['frame_jpeg'] = jpg_bytes
+                        shared_data['frame_updated'] = time.time()
 
             # Cleanup cooldowns
             if frame_counter % 30 == 0:
-                current_time = time.time()
-                recently_recognized = {k: v for k, v in recently_recognized.items()
-                                       if current_time - v < recognition_cooldown * 2}
+                _evict_expired(recently_recognized, time.monotonic(), recognition_cooldown * 2)
 
             # NEW: Check if 1 hour has passed and mark remaining students absent
             if not attendance_active:
@@ -741,8 +1342,6 @@ def main(shared_data):
                     shared_data['absence_marked'] = True
                     
                     try:
-                        # Get all students for this subject/year
-                        students = load_student_data()
                         subject_year = get_subject_year(current_lecture)
                         
                         if subject_year:
@@ -752,20 +1351,13 @@ def main(shared_data):
                             key = f"{today}_{current_lecture}"
                             
                             # Get list of students already marked present
-                            present_students = set(records.get('records', {}).get(key, {}).get('present', []))
+                            with _state_lock:
+                                present_students = set(records.get('records', {}).get(key, {}).get('present', ()))
                             
-                            marked_absent_count = 0
-                            for student_id, student_data in students.items():
-                                # Only process students in the same year as the subject
-                                if student_data.get('year') == subject_year:
-                                    # If not in present list, mark as absent
-                                    if student_id not in present_students:
-                                        student_name = student_data.get('name', 'Unknown')
-                                        success = update_attendance_in_database(
-                                            student_id, student_name, current_lecture, 'Absent'
-                                        )
-                                        if success:
-                                            marked_absent_count += 1
+                            # Students in the subject's year who never scanned, marked in one batch
+                            year_students = get_student_ids_for_year(subject_year)
+                            marked = bulk_mark_absent(year_students - present_students, current_lecture)
+                            marked_absent_count = len(marked)
                             
                             print(f"[SUCCESS] ✅ Marked {marked_absent_count} students as absent after 1 hour")
                             print("[INFO] 📊 Attendance session ended. System will continue running for live view.")
@@ -782,7 +1374,10 @@ def main(shared_data):
         import traceback
         traceback.print_exc()
     finally:
+        stop_capture.set()
+        capture_thread.join(timeout=1.0)
         cap.release()
+        flush_pending_writes()
         shared_data['running'] = False
         print("[INFO] Attendance system stopped.")
 
@@ -4,17 +4,47 @@ import re
 import logging
 from typing import Dict, Any, Optional
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from json_io import json_loads as _loads, fsync_dir as _fsync_dir
+
 logger = logging.getLogger(__name__)
 
 CURRICULUM_PATH = os.path.join(os.path.dirname(__file__), "curriculum.json")
+_SEM_RE = re.compile(r"\d+")
+
+# Parsed curriculum keyed on the file's (mtime_ns, size); None when unknown
+_cache = None
 
 
 # ---------- helpers ----------
 
+def _dumps(data: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8")
+
+
+def _invalidate_cache():
+    global _cache
+    _cache = None
+
+
 def _load() -> Dict[str, Any]:
+    """Parsed curriculum; re-read only when the file's mtime/size changes."""
+    global _cache
     try:
-        with open(CURRICULUM_PATH, "r", encoding="utf-8") as f:
-            return json.load(f)
+        st = os.stat(CURRICULUM_PATH)
+        stamp = (st.st_mtime_ns, st.st_size)
+        if _cache is not None and _cache[0] == stamp:
+            return _cache[1]
+        with open(CURRICULUM_PATH, "rb") as f:
+            data = _loads(f.read())
+        _cache = (stamp, data)
+        return data
     except FileNotFoundError:
         logger.warning(f"Curriculum file not found: {CURRICULUM_PATH}")
         return {}
@@ -24,18 +54,28 @@ def _load() -> Dict[str, Any]:
 
 
 def _save(data: Dict[str, Any]):
+    # The next _load picks up the new file (and its new mtime) from disk
+    _invalidate_cache()
     try:
         tmp = CURRICULUM_PATH + ".tmp"
-        with open(tmp, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        with open(tmp, "wb") as f:
+            f.write(_dumps(data))
+            # Data must be on disk before the rename, or a crash can leave an empty file
+            f.flush()
+            os.fsync(f.fileno())
         os.replace(tmp, CURRICULUM_PATH)
+        _fsync_dir(os.path.dirname(CURRICULUM_PATH))
     except Exception as e:
         logger.error(f"Failed to save curriculum data: {e}")
         raise
 
 
 def _sem_number(sem_name: str) -> Optional[int]:
-    m = re.search(r"\d+", sem_name)
+    # Names look like "Sem-1": take the tail without the regex engine
+    tail = sem_name.rpartition("-")[2]
+    if tail.isdigit():
+        return int(tail)
+    m = _SEM_RE.search(sem_name)
     return int(m.group()) if m else None
 
 
@@ -46,7 +86,11 @@ def detect_current_side() -> str:
     Detect whether odd or even semesters are currently active.
     Defaults to 'odd' if unclear or no semesters are marked as current.
     """
-    data = _load()
+    return _detect_side(_load())
+
+
+def _detect_side(data: Dict[str, Any]) -> str:
+    """Single counting pass over already-loaded curriculum data."""
     odd_true = 0
     even_true = 0
 
@@ -86,6 +130,7 @@ def set_side(side: str) -> Dict[str, Any]:
         raise ValueError("side must be 'odd' or 'even'")
 
     data = _load()
+    changed = False
 
     try:
         for year in data.values():
@@ -99,15 +144,23 @@ def set_side(side: str) -> Dict[str, Any]:
                 if not num:
                     continue
 
-                sem["Current"] = (
-                    num % 2 == 1 if side == "odd" else num % 2 == 0
-                )
+                current = num % 2 == 1 if side == "odd" else num % 2 == 0
+                if sem.get("Current") != current:
+                    sem["Current"] = current
+                    changed = True
     except (AttributeError, TypeError) as e:
+        # data is the cached dict and may be half-updated
+        _invalidate_cache()
         logger.error(f"Error updating curriculum data: {e}")
         raise
 
-    _save(data)
-    return get_state()
+    # Re-selecting the active side leaves the file untouched
+    if changed:
+        _save(data)
+    # Decide from the data just written instead of re-reading the file
+    return {
+        "current_side": _detect_side(data)
+    }
 
 
 def toggle() -> Dict[str, Any]:
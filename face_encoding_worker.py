@@ -0,0 +1,41 @@
+"""
+Face encoding for training, kept apart from attendance_system so the
+process-pool workers only import cv2, numpy and face_recognition.
+"""
+
+import cv2
+import numpy as np
+import face_recognition
+
+
+def fix_image_format(img):
+    if img is None:
+        return None
+    if not isinstance(img, np.ndarray):
+        img = np.array(img)
+    if img.size == 0:
+        return None
+    if len(img.shape) == 3:
+        if img.shape[2] == 4:
+            img = cv2.cvtColor(img, cv2.COLOR_RGBA2RGB)
+        elif img.shape[2] == 3:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    elif len(img.shape) == 2:
+        img = cv2.cvtColor(img, cv2.COLOR_GRAY2RGB)
+    if img.dtype != np.uint8:
+        img = (img * 255).astype(np.uint8) if img.max() <= 1.0 else img.astype(np.uint8)
+    if not img.flags['C_CONTIGUOUS']:
+        img = np.ascontiguousarray(img)
+    return img
+
+
+def encode_image_file(path):
+    """Encode the first face found in an image file (None if unreadable or no face)"""
+    img = cv2.imread(path)
+    if img is None:
+        return None
+    img_rgb = fix_image_format(img)
+    if img_rgb is None:
+        return None
+    encodes = face_recognition.face_encodings(img_rgb)
+    return encodes[0] if encodes else None
@@ -18,7 +18,7 @@ def init_ip_access_config():
         
         try:
             with open(IP_ACCESS_CONFIG_FILE, 'w', encoding='utf-8') as f:
-                json.dump(default_config, f, indent=4)
+                json.dump(default_config, f, separators=(',', ':'))
             print(f"[INFO] Created {IP_ACCESS_CONFIG_FILE}")
             return True
         except Exception as e:
@@ -10,12 +10,26 @@ Purpose: Restrict network devices to mobile attendance page only
 
 import json
 import os
+import time
 from datetime import datetime, timedelta
 
+from json_io import json_loads as _json_loads
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Configuration
 ACCESS_CONTROL_FILE = "mobile_access_control.json"
 DEFAULT_EXPIRY_MINUTES = 5
 
+# LAN IP found by get_lan_ip, reused for the life of the process
+_lan_ip_cache = None
+
+# In-process copy of the access control file: (file stamp, data, expiry epoch seconds)
+_cache = None
+
 # ============================================================================
 # UTILITY FUNCTIONS
 # ============================================================================
@@ -24,6 +38,9 @@ def get_lan_ip():
     """
     Get the server's LAN IP address.
     
+    The address is looked up once and cached; call invalidate_lan_ip_cache()
+    after a network change. Failed lookups are not cached.
+    
     Returns:
         str: LAN IP address or "UNKNOWN" if detection fails
     
@@ -31,6 +48,10 @@ def get_lan_ip():
         >>> get_lan_ip()
         '192.168.1.100'
     """
+    global _lan_ip_cache
+    if _lan_ip_cache:
+        return _lan_ip_cache
+
     import socket
     try:
         # Create UDP socket (doesn't actually send data)
@@ -38,12 +59,19 @@ def get_lan_ip():
         s.connect(("8.8.8.8", 80))  # Google DNS
         ip = s.getsockname()[0]
         s.close()
+        _lan_ip_cache = ip
         return ip
     except Exception as e:
         print(f"[ERROR] Failed to get LAN IP: {e}")
         return "UNKNOWN"
 
 
+def invalidate_lan_ip_cache():
+    """Forget the cached LAN IP so the next get_lan_ip() looks it up again."""
+    global _lan_ip_cache
+    _lan_ip_cache = None
+
+
 def is_localhost(ip):
     """
     Check if IP address is localhost.
@@ -80,6 +108,35 @@ def is_network_device(ip):
 # JSON STORAGE OPERATIONS
 # ============================================================================
 
+def _json_dumps(data):
+    """Serialize to compact JSON bytes (the file is machine-only, no pretty-printing)."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+
+def _file_stamp():
+    """mtime/size of the access control file, used to detect outside edits."""
+    st = os.stat(ACCESS_CONTROL_FILE)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _parse_expiry(data):
+    """Expiry as epoch seconds, once per file version (None if unset or invalid)."""
+    expiry_ts = data.get("expiry_ts")
+    if expiry_ts is not None:
+        return float(expiry_ts)
+    # Files written before expiry_ts existed only carry the ISO string
+    expiry_time = data.get("expiry_time")
+    if not expiry_time:
+        return None
+    try:
+        return datetime.fromisoformat(expiry_time).timestamp()
+    except Exception as e:
+        print(f"[ERROR] Failed to check expiry: {e}")
+        return None
+
+
 def load_access_control():
     """
     Load access control state from JSON file.
@@ -88,33 +145,19 @@ def load_access_control():
         dict: Access control data with keys:
             - enabled (bool): Whether mobile access is active
             - expiry_time (str): ISO format timestamp
+            - expiry_ts (float): Same expiry as epoch seconds
             - activated_at (str): ISO format timestamp
     
     File Structure:
         {
             "enabled": false,
             "expiry_time": "2024-01-15T14:30:00",
+            "expiry_ts": 1705329000.0,
             "activated_at": "2024-01-15T14:25:00",
             "duration_minutes": 5
         }
     """
-    try:
-        if os.path.exists(ACCESS_CONTROL_FILE):
-            with open(ACCESS_CONTROL_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        # Return default state if file doesn't exist
-        return {
-            "enabled": False,
-            "expiry_time": None,
-            "activated_at": None
-        }
-    except Exception as e:
-        print(f"[ERROR] Failed to load access control: {e}")
-        return {
-            "enabled": False,
-            "expiry_time": None,
-            "activated_at": None
-        }
+    return _load_with_expiry()[0]
 
 
 def save_access_control(data):
@@ -127,20 +170,54 @@ def save_access_control(data):
     Returns:
         bool: True if save successful, False otherwise
     """
+    global _cache
     try:
         # Atomic write: write to temp file, then rename
         temp_file = ACCESS_CONTROL_FILE + '.tmp'
-        with open(temp_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=4)
+        with open(temp_file, 'wb') as f:
+            f.write(_json_dumps(data))
+            # Data must be on disk before the rename, or a crash can leave an empty file
+            f.flush()
+            os.fsync(f.fileno())
         
         # Rename (atomic on most systems)
         os.replace(temp_file, ACCESS_CONTROL_FILE)
+
+        _cache = (_file_stamp(), data, _parse_expiry(data))
         return True
     except Exception as e:
         print(f"[ERROR] Failed to save access control: {e}")
         return False
 
 
+def _load_with_expiry():
+    """Return (data, expiry epoch seconds), re-parsing only when the file changed."""
+    global _cache
+    default = {
+        "enabled": False,
+        "expiry_time": None,
+        "activated_at": None
+    }
+    try:
+        # Checked on every request by the middleware: one stat, re-parse only when the file changed.
+        # _cache is read once, so a concurrent save can't mix two versions.
+        stamp = _file_stamp()
+        cache = _cache
+        if cache is not None and cache[0] == stamp:
+            return cache[1], cache[2]
+        with open(ACCESS_CONTROL_FILE, 'rb') as f:
+            data = _json_loads(f.read())
+        expiry_ts = _parse_expiry(data)
+        _cache = (stamp, data, expiry_ts)
+        return data, expiry_ts
+    except FileNotFoundError:
+        # Default state if the file doesn't exist
+        return default, None
+    except Exception as e:
+        print(f"[ERROR] Failed to load access control: {e}")
+        return default, None
+
+
 # ============================================================================
 # ACCESS CONTROL LOGIC
 # ============================================================================
@@ -156,36 +233,28 @@ def is_mobile_access_enabled():
         - Automatically disables access if expired
     
     Logic Flow:
-        1. Load current state from JSON
+        1. Load current state (cached until the file changes)
         2. Check if enabled flag is True
         3. Check if current time < expiry time
         4. Auto-disable if expired
     """
-    data = load_access_control()
+    data, expiry_ts = _load_with_expiry()
     
     # Check enabled flag
     if not data.get("enabled", False):
         return False
     
     # Check expiry time
-    expiry_time = data.get("expiry_time")
-    if not expiry_time:
+    if expiry_ts is None:
         return False
     
-    try:
-        expiry_dt = datetime.fromisoformat(expiry_time)
-        now = datetime.now()
-        
-        # Check if expired
-        if now > expiry_dt:
-            # Auto-disable expired access
-            disable_mobile_access()
-            return False
-        
-        return True
-    except Exception as e:
-        print(f"[ERROR] Failed to check expiry: {e}")
+    # Check if expired
+    if time.time() > expiry_ts:
+        # Auto-disable expired access
+        disable_mobile_access()
         return False
+    
+    return True
 
 
 def enable_mobile_access(duration_minutes=DEFAULT_EXPIRY_MINUTES):
@@ -211,6 +280,7 @@ def enable_mobile_access(duration_minutes=DEFAULT_EXPIRY_MINUTES):
             "enabled": True,
             "activated_at": now.isoformat(),
             "expiry_time": expiry_time.isoformat(),
+            "expiry_ts": expiry_time.timestamp(),
             "duration_minutes": duration_minutes
         }
         
@@ -272,7 +342,7 @@ def get_access_status():
         >>> print(f"Enabled: {status['enabled']}")
         >>> print(f"Time left: {status['remaining_formatted']}")
     """
-    data = load_access_control()
+    data, expiry_ts = _load_with_expiry()
     
     # Default status (disabled)
     status = {
@@ -287,22 +357,21 @@ def get_access_status():
     if not data.get("enabled", False):
         return status
     
+    # The ISO string is only kept for display
     expiry_time = data.get("expiry_time")
-    if not expiry_time:
+    if expiry_ts is None:
         return status
     
     try:
-        expiry_dt = datetime.fromisoformat(expiry_time)
-        now = datetime.now()
+        remaining = expiry_ts - time.time()
         
         # Check if expired
-        if now > expiry_dt:
+        if remaining < 0:
             disable_mobile_access()
             return status
         
         # Calculate remaining time
-        remaining = expiry_dt - now
-        remaining_seconds = int(remaining.total_seconds())
+        remaining_seconds = int(remaining)
         
         status = {
             "enabled": True,
@@ -0,0 +1,31 @@
+"""
+JSON file helpers shared by the attendance, mobile, access-control and
+curriculum modules. Pure stdlib (orjson is used when installed), so the
+lightweight modules can import it without pulling in cv2/numpy.
+"""
+
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def json_loads(raw):
+    """Parse JSON bytes (orjson when installed, stdlib json otherwise)."""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def fsync_dir(dirpath):
+    """Persist a rename in dirpath (no-op where directories can't be opened, e.g. Windows)."""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(dirpath or ".", os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
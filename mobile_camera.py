@@ -10,11 +10,31 @@ import json
 import os
 from datetime import datetime
 
+try:
+    import simplejpeg
+except ImportError:
+    simplejpeg = None
+
+
+def decode_image_bytes(image_bytes):
+    """Decode encoded image bytes to an RGB numpy array"""
+    # libjpeg-turbo straight into a numpy buffer for JPEGs (what phone cameras send)
+    if simplejpeg is not None and simplejpeg.is_jpeg(image_bytes):
+        return simplejpeg.decode_jpeg(image_bytes, colorspace='RGB')
+
+    # PNG and other formats go through PIL
+    image = Image.open(BytesIO(image_bytes))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return np.array(image)
+
 
 class MobileFaceRecognition:
     def __init__(self):
         self.known_face_encodings = []
         self.known_face_names = []
+        self.known_mat = np.empty((0, 128), dtype=np.float32)
+        self.known_sqnorm = np.empty(0, dtype=np.float32)
         self.load_encodings()
 
     def load_encodings(self):
@@ -22,7 +42,14 @@ class MobileFaceRecognition:
         try:
             with open('EncodeFile.p', 'rb') as f:
                 encode_list_known_with_ids = pickle.load(f)
-                self.known_face_encodings, self.known_face_names = encode_list_known_with_ids
+                known_encodings, self.known_face_names = encode_list_known_with_ids
+            # One contiguous float32 matrix plus row norms for the batched distance below;
+            # zero-copy when EncodeFile.p already holds a float32 matrix
+            self.known_mat = np.ascontiguousarray(
+                np.asarray(known_encodings, dtype=np.float32).reshape(-1, 128))
+            # The matrix replaces the unpickled list so float64 copies are not kept around
+            self.known_face_encodings = self.known_mat
+            self.known_sqnorm = np.einsum('ij,ij->i', self.known_mat, self.known_mat)
             print(f"[INFO] Loaded {len(self.known_face_names)} face encodings")
         except FileNotFoundError:
             print("[ERROR] EncodeFile.p not found. Please run train_images.py first")
@@ -38,14 +65,7 @@ class MobileFaceRecognition:
 
             # Decode base64 image
             image_bytes = base64.b64decode(image_data)
-            image = Image.open(BytesIO(image_bytes))
-
-            # Convert to RGB if needed
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-
-            # Convert PIL image to numpy array
-            img_array = np.array(image)
+            img_array = decode_image_bytes(image_bytes)
 
             return self.recognize_faces_in_image(img_array)
 
@@ -57,14 +77,12 @@ class MobileFaceRecognition:
         """Process uploaded file and return recognition results"""
         try:
             # Read image file
-            image = Image.open(file)
-
-            # Convert to RGB if needed
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-
-            # Convert PIL image to numpy array
-            img_array = np.array(image)
+            if hasattr(file, 'read'):
+                image_bytes = file.read()
+            else:
+                with open(file, 'rb') as f:
+                    image_bytes = f.read()
+            img_array = decode_image_bytes(image_bytes)
 
             return self.recognize_faces_in_image(img_array)
 
@@ -75,39 +93,46 @@ class MobileFaceRecognition:
     def recognize_faces_in_image(self, img_array):
         """Recognize faces in the given image array"""
         try:
-            # Resize image for faster processing
-            small_frame = cv2.resize(img_array, (0, 0), fx=0.25, fy=0.25)
-            rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+            # Resize image for faster processing (input is already RGB from the decoders)
+            rgb_small_frame = cv2.resize(img_array, (0, 0), fx=0.25, fy=0.25, interpolation=cv2.INTER_AREA)
 
             # Find face locations and encodings
             face_locations = face_recognition.face_locations(rgb_small_frame)
+            if not face_locations:
+                # Common while the user is still framing the shot: skip the encoder call
+                return [{'student_id': 'No face detected', 'confidence': 0.0, 'recognized': False}]
             face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
 
             results = []
 
-            for face_encoding in face_encodings:
-                # Compare with known faces
-                matches = face_recognition.compare_faces(self.known_face_encodings, face_encoding)
-                face_distances = face_recognition.face_distance(self.known_face_encodings, face_encoding)
-
-                if len(face_distances) > 0:
-                    best_match_index = np.argmin(face_distances)
-
-                    if matches[best_match_index] and face_distances[best_match_index] < 0.6:
-                        student_id = self.known_face_names[best_match_index]
-                        confidence = 1 - face_distances[best_match_index]
-
-                        results.append({
-                            'student_id': student_id,
-                            'confidence': float(confidence),
-                            'recognized': True
-                        })
-                    else:
-                        results.append({
-                            'student_id': 'Unknown',
-                            'confidence': 0.0,
-                            'recognized': False
-                        })
+            if face_encodings and len(self.known_mat) > 0:
+                # All faces against all known encodings in one matmul:
+                # |a - b|^2 = |a|^2 + |b|^2 - 2 a.b
+                faces = np.asarray(face_encodings, dtype=np.float32)
+                d2 = (self.known_sqnorm[None, :]
+                      + np.einsum('ij,ij->i', faces, faces)[:, None]
+                      - 2.0 * (faces @ self.known_mat.T))
+                best = d2.argmin(axis=1)
+                best_dist = np.sqrt(np.maximum(d2[np.arange(len(faces)), best], 0.0))
+            else:
+                best = best_dist = ()
+
+            for best_match_index, distance in zip(best, best_dist):
+                if distance < 0.6:
+                    student_id = self.known_face_names[best_match_index]
+                    confidence = 1 - distance
+
+                    results.append({
+                        'student_id': student_id,
+                        'confidence': float(confidence),
+                        'recognized': True
+                    })
+                else:
+                    results.append({
+                        'student_id': 'Unknown',
+                        'confidence': 0.0,
+                        'recognized': False
+                    })
 
             return results if results else [{'student_id': 'No face detected', 'confidence': 0.0, 'recognized': False}]
 
@@ -8,14 +8,72 @@ Version: 2.0 (Simplified)
 Routes: Only 2 routes - mobile_attendance page and mobile_recognize API
 """
 
-from flask import render_template, request, jsonify
+from flask import render_template, request, jsonify, Response, session
 from functools import wraps
 import cv2
 import numpy as np
+import dlib
 import face_recognition
-import json
 import os
-from datetime import datetime
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import attendance_system
+from ip_access_control import check_mobile_access, get_lan_ip
+from json_io import json_loads
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB
+    _TJ = TurboJPEG()
+except Exception:
+    # PyTurboJPEG missing or libturbojpeg not found: uploads are decoded with OpenCV
+    _TJ = None
+
+# OpenCV >= 4.10 can decode straight to RGB, skipping the BGR->RGB pass
+_IMREAD_COLOR_RGB = getattr(cv2, 'IMREAD_COLOR_RGB', None)
+
+ENCODE_FILE = 'EncodeFile.p'
+MATCH_TOLERANCE = 0.5  # max face distance accepted as a match (0.5 is good balance)
+DETECT_MAX_SIDE = 640  # phone photos are downscaled to this longest side for detection
+ENCODE_BATCH_WINDOW = 0.02  # seconds to wait for other requests to share a descriptor batch
+ENCODE_BATCH_MAX = 8
+CLIENT_REUSE_SECONDS = 5.0  # how long a client's last encoding may be reused
+CLIENT_REUSE_MAX_BITS = 4  # max pHash bits that may differ for a photo to count as the same shot
+CLIENT_REUSE_MAX_ENTRIES = 128
+CLIENT_REUSE_MIN_IOU = 0.8  # the new face box must overlap the cached one this much
+ANN_MIN_ENCODINGS = 100  # below this a plain matrix-vector scan is faster than an index
+ANN_RESCORE_K = 8  # index candidates re-checked with exact float32 distances
+IVFPQ_MIN_ENCODINGS = 10000  # from here faiss IVF64,PQ16 beats a full scan (and has enough training rows)
+RECOGNITION_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+RECOGNITION_TIMEOUT = 10  # seconds a request waits for its recognition job
+
+# Parsed EncodeFile.p, reused until the file's (mtime_ns, size) changes
+_ENC_CACHE = {'stamp': None, 'data': None}
 
 # ============================================================================
 # DECORATOR - Mobile Access Required
@@ -29,13 +87,11 @@ def mobile_access_required(f):
     """
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        from ip_access_control import check_mobile_access
-        
         client_ip = request.remote_addr
         allowed, reason = check_mobile_access(client_ip)
         
         if not allowed:
-            return jsonify({
+            return ojsonify({
                 'success': False,
                 'message': 'Mobile access is disabled',
                 'reason': reason
@@ -49,12 +105,38 @@ def mobile_access_required(f):
 # DATA LOADING FUNCTIONS
 # ============================================================================
 
+def ojsonify(obj):
+    """
+    JSON response for the mobile API, serialised with orjson when installed.
+    
+    Args:
+        obj (dict): Response payload (plain Python types only)
+    
+    Returns:
+        flask.Response: application/json response (status set by the caller,
+                        e.g. ``return ojsonify({...}), 400``)
+    """
+    if orjson is None:
+        return jsonify(obj)
+    return Response(orjson.dumps(obj), mimetype='application/json')
+
+
 def load_student_encodings():
     """
-    Load pre-computed face encodings from pickle file.
+    Load pre-computed face encodings.
+    
+    Reads the pickle-free EncodeFile.npy / EncodeFile.ids.json copy
+    (regenerated from EncodeFile.p when that is newer). The result is
+    cached in memory and only re-read when EncodeFile.p changes on disk
+    (e.g. after retraining).
     
     Returns:
-        tuple: (encode_list, student_ids) or None if file doesn't exist
+        dict or None if file doesn't exist:
+            - matrix: contiguous (N, 128) float32 encodings
+            - ids: student IDs, one per row
+            - sq_norms: squared L2 norm of each row
+            - index: ('ivfpq' | 'hnsw' | 'sq8', index) over the rows, or None for
+              small classes or when neither hnswlib nor faiss is installed
     
     File Structure:
         EncodeFile.p contains:
@@ -62,19 +144,262 @@ def load_student_encodings():
             [encoding1, encoding2, ...],  # List of face encodings
             ['IT-01', 'IT-02', ...]       # Corresponding student IDs
         ]
+        EncodeFile.npy holds the same encodings as one float32 matrix and
+        EncodeFile.ids.json the IDs.
     """
     try:
-        import pickle
-        if os.path.exists('EncodeFile.p'):
-            with open('EncodeFile.p', 'rb') as file:
-                return pickle.load(file)
-        print("[WARN] EncodeFile.p not found")
-        return None
+        try:
+            st = os.stat(ENCODE_FILE)
+        except FileNotFoundError:
+            print("[WARN] EncodeFile.p not found")
+            return None
+        
+        stamp = (st.st_mtime_ns, st.st_size)
+        if _ENC_CACHE['stamp'] == stamp:
+            return _ENC_CACHE['data']
+        
+        encode_list, student_ids = attendance_system.load_encodings_npy()
+        encode_matrix = np.ascontiguousarray(
+            np.asarray(encode_list, dtype=np.float32).reshape(-1, 128))
+        data = {
+            'matrix': encode_matrix,
+            'ids': list(student_ids),
+            'sq_norms': np.einsum('ij,ij->i', encode_matrix, encode_matrix),
+            'index': _build_ann_index(encode_matrix),
+        }
+        
+        _ENC_CACHE['data'] = data
+        _ENC_CACHE['stamp'] = stamp
+        return data
     except Exception as e:
         print(f"[ERROR] Failed to load encodings: {e}")
         return None
 
 
+def _build_ann_index(encode_matrix):
+    """Candidate index over the known encodings for large classes, or None if not worth it."""
+    n, dim = encode_matrix.shape
+    if n < ANN_MIN_ENCODINGS:
+        return None
+    if faiss is not None and n >= IVFPQ_MIN_ENCODINGS:
+        # 64 coarse cells, 16-byte PQ codes: only a few cells are scanned per query
+        index = faiss.index_factory(dim, "IVF64,PQ16", faiss.METRIC_L2)
+        index.train(encode_matrix)
+        index.add(encode_matrix)
+        faiss.extract_index_ivf(index).nprobe = 8
+        return ('ivfpq', index)
+    if hnswlib is not None:
+        index = hnswlib.Index(space='l2', dim=dim)
+        index.init_index(max_elements=n, ef_construction=200, M=16)
+        index.add_items(encode_matrix, np.arange(n))
+        index.set_ef(50)
+        return ('hnsw', index)
+    if faiss is not None:
+        # 8-bit scalar quantisation: 128 B per encoding instead of 512 B to scan
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2)
+        index.train(encode_matrix)
+        index.add(encode_matrix)
+        return ('sq8', index)
+    return None
+
+
+def _nearest_sq_l2(matrix, probe):
+    """Index and squared L2 distance of the row of matrix closest to probe."""
+    best = np.inf
+    best_index = -1
+    for i in range(matrix.shape[0]):
+        d = 0.0
+        for j in range(matrix.shape[1]):
+            diff = matrix[i, j] - probe[j]
+            d += diff * diff
+        if d < best:
+            best = d
+            best_index = i
+    return best_index, best
+
+
+if njit is not None:
+    # Fused subtract/square/sum in one pass; for a class-sized matrix this beats
+    # the BLAS call overhead. Compiled here so no request pays the JIT cost:
+    # numba specialises on writability, and the memory-mapped matrix is read-only
+    # (a freshly migrated one is writable), so both variants are warmed up.
+    _nearest_sq_l2 = njit(cache=True, fastmath=True)(_nearest_sq_l2)
+    _warm_probe = np.zeros(128, dtype=np.float32)
+    _warm_matrix = np.zeros((1, 128), dtype=np.float32)
+    _nearest_sq_l2(_warm_matrix, _warm_probe)
+    _warm_matrix.setflags(write=False)
+    _nearest_sq_l2(_warm_matrix, _warm_probe)
+    del _warm_probe, _warm_matrix
+
+
+def find_best_match(data, encode_test):
+    """
+    Find the closest known face to a probe encoding.
+    
+    Small classes are scanned exactly, with a Numba-compiled loop when
+    numba is installed or one matrix-vector product otherwise.
+    With an index, its top ANN_RESCORE_K candidates are re-scored with
+    exact float32 distances, so the tolerance check never sees
+    approximate (or quantised) values.
+    
+    Returns:
+        tuple: (match_index, distance)
+    """
+    matrix = data['matrix']
+    sq_norms = data['sq_norms']
+    probe = encode_test.astype(np.float32)
+    probe_sq = float(np.dot(probe, probe))
+    
+    if data['index'] is None and njit is not None:
+        match_index, sq_dist = _nearest_sq_l2(matrix, probe)
+        return int(match_index), float(np.sqrt(max(sq_dist, 0.0)))
+    
+    if data['index'] is None:
+        # |k - p|^2 = |k|^2 + |p|^2 - 2 k.p for every known face at once
+        sq_dists = sq_norms + probe_sq - 2.0 * (matrix @ probe)
+        match_index = int(np.argmin(sq_dists))
+        return match_index, float(np.sqrt(max(sq_dists[match_index], 0.0)))
+    
+    kind, index = data['index']
+    k = min(ANN_RESCORE_K, len(matrix))
+    if kind == 'hnsw':
+        labels, _ = index.knn_query(probe, k=k)
+    else:
+        _, labels = index.search(probe.reshape(1, -1), k)
+    candidates = np.asarray(labels[0], dtype=np.int64)
+    candidates = candidates[candidates >= 0]
+    
+    sq_dists = sq_norms[candidates] + probe_sq - 2.0 * (matrix[candidates] @ probe)
+    best = int(np.argmin(sq_dists))
+    return int(candidates[best]), float(np.sqrt(max(sq_dists[best], 0.0)))
+
+
+def read_upload_buffer(file):
+    """
+    Get the bytes of an uploaded file without an extra full-size copy.
+    
+    Small uploads are held by Werkzeug in a BytesIO, whose buffer is
+    exposed directly; spooled (on-disk) uploads are read into one
+    preallocated bytearray. Both support the buffer protocol.
+    A returned memoryview must be released once decoded (see mobile_recognize).
+    """
+    stream = file.stream
+    if isinstance(stream, BytesIO):
+        return stream.getbuffer()
+    try:
+        stream.seek(0, os.SEEK_END)
+        size = stream.tell()
+        stream.seek(0)
+        buf = bytearray(size)
+        view = memoryview(buf)
+        got = 0
+        while got < size:
+            n = stream.readinto(view[got:])
+            if not n:
+                break
+            got += n
+        return view[:got]
+    except (AttributeError, OSError):
+        stream.seek(0)
+        return stream.read()
+
+
+def jpeg_exif_orientation(image_bytes):
+    """
+    Read the EXIF Orientation tag (1-8) of a JPEG.
+    
+    Phones store portrait shots sideways and set this tag instead of
+    rotating the pixels; libjpeg-turbo ignores it, so the caller has to.
+    
+    Returns:
+        int: Orientation value, 1 (upright) when absent or unreadable
+    """
+    data = image_bytes
+    n = len(data)
+    i = 2  # after SOI
+    while i + 4 <= n:
+        if data[i] != 0xFF:
+            return 1
+        marker = data[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker in (0xD9, 0xDA):  # EOI / start of scan: no metadata after this
+            return 1
+        seg_len = int.from_bytes(bytes(data[i + 2:i + 4]), 'big')
+        if marker == 0xE1 and bytes(data[i + 4:i + 10]) == b'Exif\x00\x00':
+            tiff = bytes(data[i + 10:i + 2 + seg_len])
+            order = {b'II': 'little', b'MM': 'big'}.get(tiff[:2])
+            if order is None or len(tiff) < 8:
+                return 1
+            ifd = int.from_bytes(tiff[4:8], order)
+            count = int.from_bytes(tiff[ifd:ifd + 2], order) if ifd + 2 <= len(tiff) else 0
+            for k in range(count):
+                entry = ifd + 2 + 12 * k
+                if entry + 12 > len(tiff):
+                    break
+                if int.from_bytes(tiff[entry:entry + 2], order) == 0x0112:
+                    value = int.from_bytes(tiff[entry + 8:entry + 10], order)
+                    return value if 1 <= value <= 8 else 1
+            return 1
+        i += 2 + seg_len
+    return 1
+
+
+def _apply_exif_orientation(img, orientation):
+    """Turn a decoded image upright according to its EXIF Orientation value."""
+    if orientation == 2:
+        return cv2.flip(img, 1)
+    if orientation == 3:
+        return cv2.rotate(img, cv2.ROTATE_180)
+    if orientation == 4:
+        return cv2.flip(img, 0)
+    if orientation == 5:
+        return cv2.transpose(img)
+    if orientation == 6:
+        return cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
+    if orientation == 7:
+        return cv2.rotate(cv2.transpose(img), cv2.ROTATE_180)
+    if orientation == 8:
+        return cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    return img
+
+
+def decode_upload_rgb(image_bytes):
+    """
+    Decode an uploaded photo to an RGB array, or None if it can't be decoded.
+    
+    JPEGs are decoded by libjpeg-turbo straight to RGB, using its DCT scaling
+    (1/2, 1/4, 1/8) to skip full-resolution work while keeping the longest
+    side at least DETECT_MAX_SIDE, then turned upright per their EXIF
+    Orientation tag. Other formats go through cv2.imdecode,
+    which decodes to RGB directly on OpenCV >= 4.10.
+    """
+    if _TJ is not None and bytes(image_bytes[:2]) == b'\xff\xd8':
+        try:
+            width, height, _, _ = _TJ.decode_header(image_bytes)
+            factor = 1
+            for denom in (8, 4, 2):
+                if (1, denom) in _TJ.scaling_factors and max(width, height) // denom >= DETECT_MAX_SIDE:
+                    factor = denom
+                    break
+            img = _TJ.decode(image_bytes, pixel_format=TJPF_RGB, scaling_factor=(1, factor))
+            # cv2.imdecode honours EXIF orientation; TurboJPEG does not
+            return _apply_exif_orientation(img, jpeg_exif_orientation(image_bytes))
+        except Exception as e:
+            print(f"[WARN] TurboJPEG decode failed, using OpenCV: {e}")
+    
+    buf = np.frombuffer(image_bytes, np.uint8)
+    if _IMREAD_COLOR_RGB is not None:
+        return cv2.imdecode(buf, _IMREAD_COLOR_RGB)
+    img = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    # OpenCV decodes to BGR; swap channels in place rather than into a second
+    # buffer (dlib needs a contiguous array, so a reversed view won't do)
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB, dst=img)
+
+
 def load_student_data():
     """
     Load student information from JSON database.
@@ -93,8 +418,8 @@ def load_student_data():
         }
     """
     try:
-        with open('student_data.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
+        with open('student_data.json', 'rb') as f:
+            return json_loads(f.read())
     except FileNotFoundError:
         print("[WARN] student_data.json not found")
         return {}
@@ -103,50 +428,299 @@ def load_student_data():
         return {}
 
 
-def load_attendance_records():
+def get_teacher_info():
     """
-    Load attendance records from JSON database.
+    Current teacher/lecture info from current_teacher.json.
+    
+    Uses attendance_system's parsed-JSON cache, so the file is only
+    re-read when its mtime/size changes (once per lecture in practice).
+    Treat the returned dict as read-only.
     
     Returns:
-        dict: Attendance records with structure:
-        {
-            "records": {
-                "2024-01-15_Python": {
-                    "present": ["IT-01", "IT-02"],
-                    "absent": ["IT-03"],
-                    "time": "10:30:00"
-                }
-            }
-        }
+        dict: Teacher info, or {} if the file is missing or invalid
     """
-    try:
-        with open('attendance_records.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        print("[WARN] attendance_records.json not found")
-        return {'records': {}}
-    except Exception as e:
-        print(f"[ERROR] Failed to load attendance: {e}")
-        return {'records': {}}
+    return attendance_system.get_current_teacher()
+
+
+# ============================================================================
+# FACE DETECTION
+# ============================================================================
+
+# Same YuNet model as the laptop loop (None when models/face_detection_yunet.onnx is absent).
+# A cv2 detector is not safe to share between request threads, hence the lock.
+_face_detector = attendance_system.load_face_detector((320, 320))
+_face_detector_lock = threading.Lock()
+
+# dlib fallback: the CNN detector only pays off when dlib was built with CUDA
+_DLIB_DETECT_MODEL = 'cnn' if getattr(dlib, 'DLIB_USE_CUDA', False) else 'hog'
+
+
+def detect_faces(img_rgb):
+    """
+    Find faces in an RGB photo, returning (top, right, bottom, left) boxes
+    in the photo's own coordinates.
+    
+    Detection runs on a copy downscaled to DETECT_MAX_SIDE (detector cost
+    grows with pixel count); the boxes are mapped back so the encoder
+    still sees the full-resolution face.
+    """
+    h, w = img_rgb.shape[:2]
+    scale = 1.0
+    small = img_rgb
+    if max(h, w) > DETECT_MAX_SIDE:
+        scale = DETECT_MAX_SIDE / max(h, w)
+        small = cv2.resize(img_rgb, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    
+    if _face_detector is not None:
+        small_bgr = cv2.cvtColor(small, cv2.COLOR_RGB2BGR)
+        with _face_detector_lock:
+            locations = attendance_system.detect_face_locations(_face_detector, small_bgr)
+    else:
+        # dlib detector called directly: face_locations would upsample the
+        # photo once more, which a downscaled selfie does not need
+        if _DLIB_DETECT_MODEL == 'cnn':
+            rects = [d.rect for d in face_recognition.api.cnn_face_detector(small, 0)]
+        else:
+            rects = face_recognition.api.face_detector(small, 0)
+        sh, sw = small.shape[:2]
+        locations = [
+            (max(r.top(), 0), min(r.right(), sw), min(r.bottom(), sh), max(r.left(), 0))
+            for r in rects
+        ]
+    
+    if scale == 1.0:
+        return locations
+    return [
+        (int(t / scale), min(int(r / scale), w), min(int(b / scale), h), int(l / scale))
+        for (t, r, b, l) in locations
+    ]
 
 
-def save_attendance_records(data):
+# ============================================================================
+# PER-CLIENT ENCODING REUSE
+# ============================================================================
+
+# (client IP, browser session id) -> (face pHash, face box, encoding, monotonic time),
+# least recently used first
+_client_encodings = OrderedDict()
+_client_encodings_lock = threading.Lock()
+
+
+def client_reuse_key():
+    """
+    Identify the uploading device for encoding reuse.
+    
+    The IP alone is shared behind NAT or a hotspot, so it is combined
+    with a random id kept in the browser's session cookie.
+    Must be called inside the request context.
+    """
+    client_id = session.get('mobile_client_id')
+    if client_id is None:
+        client_id = session['mobile_client_id'] = uuid.uuid4().hex
+    return request.remote_addr, client_id
+
+
+def perceptual_hash(img_rgb):
+    """
+    64-bit DCT perceptual hash (pHash) of an RGB image.
+    
+    Grey 32x32 thumbnail -> DCT -> low 8x8 frequencies -> one bit per
+    coefficient above their median. Near-identical photos differ in a
+    few bits only.
+    """
+    grey = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2GRAY)
+    thumb = cv2.resize(grey, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(thumb)[:8, :8].ravel()
+    bits = low > np.median(low)
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def _box_iou(a, b):
+    """Intersection over union of two (top, right, bottom, left) boxes."""
+    inter_h = min(a[2], b[2]) - max(a[0], b[0])
+    inter_w = min(a[1], b[1]) - max(a[3], b[3])
+    if inter_h <= 0 or inter_w <= 0:
+        return 0.0
+    inter = inter_h * inter_w
+    area_a = (a[2] - a[0]) * (a[1] - a[3])
+    area_b = (b[2] - b[0]) * (b[1] - b[3])
+    return inter / float(area_a + area_b - inter)
+
+
+def lookup_client_encoding(client_key, face_hash, face_box):
+    """
+    Cached encoding for this client if the same face is in the same place.
+    
+    Both the pHash of the face crop and the detected box must match the
+    client's previous photo; hashing only the crop keeps a shared
+    background from making two different students look alike.
+    """
+    with _client_encodings_lock:
+        entry = _client_encodings.get(client_key)
+        if entry is None:
+            return None
+        cached_hash, cached_box, encoding, stored_at = entry
+        if (time.monotonic() - stored_at > CLIENT_REUSE_SECONDS
+                or bin(cached_hash ^ face_hash).count('1') > CLIENT_REUSE_MAX_BITS
+                or _box_iou(cached_box, face_box) < CLIENT_REUSE_MIN_IOU):
+            return None
+        _client_encodings.move_to_end(client_key)
+        return encoding
+
+
+def remember_client_encoding(client_key, face_hash, face_box, encoding):
+    """Store the encoding of this client's latest single-face photo."""
+    with _client_encodings_lock:
+        _client_encodings[client_key] = (face_hash, face_box, encoding, time.monotonic())
+        _client_encodings.move_to_end(client_key)
+        while len(_client_encodings) > CLIENT_REUSE_MAX_ENTRIES:
+            _client_encodings.popitem(last=False)
+
+
+# ============================================================================
+# BATCHED FACE ENCODING
+# ============================================================================
+
+_encode_queue = queue.Queue()
+_encode_worker = None
+_encode_worker_lock = threading.Lock()
+
+
+def _encode_worker_loop():
+    """Collect face chips for up to ENCODE_BATCH_WINDOW and encode them in one dlib call."""
+    while True:
+        items = [_encode_queue.get()]
+        deadline = time.monotonic() + ENCODE_BATCH_WINDOW
+        while len(items) < ENCODE_BATCH_MAX:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                items.append(_encode_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        
+        try:
+            descriptors = face_recognition.api.face_encoder.compute_face_descriptor(
+                [chip for chip, _ in items], 0)
+            for (_, box), descriptor in zip(items, descriptors):
+                box['result'] = np.array(descriptor)
+        except Exception as e:
+            for _, box in items:
+                box['error'] = e
+        finally:
+            for _, box in items:
+                box['event'].set()
+
+
+def encode_face_batched(img_rgb, location):
     """
-    Save attendance records to JSON (atomic write).
+    Encode one face, sharing the ResNet call with concurrent requests.
+    
+    Landmarks and the 150x150 aligned chip are computed on the calling
+    thread (same 5-point model and padding face_recognition uses); only
+    the descriptor network is batched. If batching fails the descriptor
+    is computed directly from the same landmarks.
     
     Args:
-        data (dict): Attendance records to save
+        img_rgb (ndarray): RGB image
+        location (tuple): (top, right, bottom, left) face box
     
     Returns:
-        bool: True if save successful
+        ndarray: 128-d face encoding
     """
+    global _encode_worker
+    top, right, bottom, left = location
+    shape = face_recognition.api.pose_predictor_5_point(
+        img_rgb, dlib.rectangle(left, top, right, bottom))
     try:
-        from attendance_system import atomic_write_json
-        atomic_write_json('attendance_records.json', data)
-        return True
+        chip = dlib.get_face_chip(img_rgb, shape, size=150, padding=0.25)
+        
+        with _encode_worker_lock:
+            if _encode_worker is None:
+                _encode_worker = threading.Thread(target=_encode_worker_loop,
+                                                  name="face-encoder", daemon=True)
+                _encode_worker.start()
+        
+        box = {'event': threading.Event()}
+        _encode_queue.put((chip, box))
+        if not box['event'].wait(timeout=5.0):
+            raise TimeoutError("face encoder did not respond")
+        if 'error' in box:
+            raise box['error']
+        return box['result']
     except Exception as e:
-        print(f"[ERROR] Failed to save attendance: {e}")
-        return False
+        print(f"[WARN] Batched encoding failed, encoding directly: {e}")
+        return np.array(face_recognition.api.face_encoder.compute_face_descriptor(
+            img_rgb, shape, 0))
+
+
+# ============================================================================
+# RECOGNITION WORKER POOL
+# ============================================================================
+
+# Flask serves every request on its own thread; the pool bounds how many run
+# detection/encoding at once so a burst of uploads cannot oversubscribe the CPU
+cv2.setNumThreads(2)
+_recognition_pool = ThreadPoolExecutor(max_workers=RECOGNITION_WORKERS,
+                                       thread_name_prefix='mobile-recognize')
+
+
+def _no_match(message, student_id):
+    return {
+        'success': True,
+        'recognized': False,
+        'message': message,
+        'student_id': student_id,
+        'confidence': 0.0
+    }
+
+
+def extract_probe_encoding(img_rgb, client_key):
+    """
+    Produce the face encoding of an uploaded photo.
+    Runs on the recognition pool, outside the request context.
+
+    Args:
+        img_rgb (numpy.ndarray): Decoded RGB upload
+        client_key (tuple): client_reuse_key() of the uploader
+
+    Returns:
+        tuple: (encoding, None) on success, or (None, response_dict) when
+               no single face could be encoded
+    """
+    face_locations = detect_faces(img_rgb)
+
+    if len(face_locations) == 0:
+        return None, _no_match(
+            'No face detected in image. Please try again with better lighting.',
+            'No face detected')
+
+    if len(face_locations) > 1:
+        return None, _no_match(
+            'Multiple faces detected. Please ensure only one face is visible.',
+            'Multiple faces')
+
+    # Phones often send several frames of the same shot; skip encoding when
+    # this client's last photo shows the same face in the same place
+    location = face_locations[0]
+    top, right, bottom, left = location
+    face_crop = img_rgb[max(top, 0):bottom, max(left, 0):right]
+    face_hash = perceptual_hash(face_crop) if face_crop.size else None
+    if face_hash is not None:
+        encode_test = lookup_client_encoding(client_key, face_hash, location)
+        if encode_test is not None:
+            return encode_test, None
+
+    encode_test = encode_face_batched(img_rgb, location)
+
+    if encode_test is None:
+        return None, _no_match('Could not encode face. Please try again.',
+                               'Encoding failed')
+
+    if face_hash is not None:
+        remember_client_encoding(client_key, face_hash, location, encode_test)
+    return encode_test, None
 
 
 # ============================================================================
@@ -165,48 +739,16 @@ def mark_attendance(student_id, lecture):
         tuple: (success: bool, message: str)
     
     Logic:
-        1. Create key: "YYYY-MM-DD_LectureName"
-        2. Check if already marked present today
-        3. Remove from absent list if present
-        4. Add to present list
-        5. Save atomically
+        Delegates to attendance_system.mark_lecture_present, which updates
+        the records shared with the laptop loop under its lock and queues
+        the write.
     """
     try:
-        today = datetime.now().strftime("%Y-%m-%d")
-        current_time = datetime.now().strftime("%H:%M:%S")
-        key = f"{today}_{lecture}"
-        
-        # Load current attendance
-        attendance = load_attendance_records()
-        
-        # Initialize today's record if doesn't exist
-        if key not in attendance.get('records', {}):
-            attendance.setdefault('records', {})[key] = {
-                'present': [],
-                'absent': [],
-                'time': current_time
-            }
-        
-        record = attendance['records'][key]
-        
-        # Check if already marked present
-        if student_id in record.get('present', []):
+        if not attendance_system.mark_lecture_present(student_id, lecture):
             return False, "Already marked present today"
         
-        # Remove from absent if present there
-        if student_id in record.get('absent', []):
-            record['absent'].remove(student_id)
-        
-        # Add to present list
-        if student_id not in record.get('present', []):
-            record.setdefault('present', []).append(student_id)
-        
-        # Save changes
-        if save_attendance_records(attendance):
-            print(f"[SUCCESS] Marked {student_id} present for {lecture}")
-            return True, "Attendance marked successfully"
-        
-        return False, "Failed to save attendance"
+        print(f"[SUCCESS] Marked {student_id} present for {lecture}")
+        return True, "Attendance marked successfully"
         
     except Exception as e:
         print(f"[ERROR] Mark attendance failed: {e}")
@@ -242,18 +784,12 @@ def register_mobile_routes(app):
         """
         try:
             # Load current teacher/lecture info
-            teacher_info = {}
-            try:
-                with open('current_teacher.json', 'r', encoding='utf-8') as f:
-                    teacher_info = json.load(f)
-            except:
-                pass
+            teacher_info = get_teacher_info()
             
             teacher_name = teacher_info.get('name', 'Teacher')
             lecture = teacher_info.get('lecture', 'Unknown')
             
             # Get server IP for display
-            from ip_access_control import get_lan_ip
             server_ip = get_lan_ip()
             
             return render_template('mobile_attendance.html',
@@ -305,7 +841,7 @@ def register_mobile_routes(app):
             # STEP 1: Validate Image Upload
             # ================================================================
             if 'image' not in request.files:
-                return jsonify({
+                return ojsonify({
                     'success': False,
                     'message': 'No image uploaded'
                 }), 400
@@ -313,7 +849,7 @@ def register_mobile_routes(app):
             file = request.files['image']
             
             if file.filename == '':
-                return jsonify({
+                return ojsonify({
                     'success': False,
                     'message': 'No image selected'
                 }), 400
@@ -321,59 +857,32 @@ def register_mobile_routes(app):
             # ================================================================
             # STEP 2: Decode Image
             # ================================================================
-            image_bytes = file.read()
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            image_bytes = read_upload_buffer(file)
+            try:
+                img_rgb = decode_upload_rgb(image_bytes)
+            finally:
+                # The decoded array owns its pixels; drop the view so Werkzeug
+                # can close the upload's BytesIO (close() fails while it is exported)
+                if isinstance(image_bytes, memoryview):
+                    image_bytes.release()
             
-            if img is None:
-                return jsonify({
+            if img_rgb is None:
+                return ojsonify({
                     'success': False,
                     'message': 'Invalid image format'
                 }), 400
             
-            # Convert BGR to RGB (OpenCV uses BGR, face_recognition uses RGB)
-            img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            
-            # ================================================================
-            # STEP 3: Detect Faces
-            # ================================================================
-            face_locations = face_recognition.face_locations(img_rgb)
-            
-            # No face detected
-            if len(face_locations) == 0:
-                return jsonify({
-                    'success': True,
-                    'recognized': False,
-                    'message': 'No face detected in image. Please try again with better lighting.',
-                    'student_id': 'No face detected',
-                    'confidence': 0.0
-                })
-            
-            # Multiple faces detected
-            if len(face_locations) > 1:
-                return jsonify({
-                    'success': True,
-                    'recognized': False,
-                    'message': 'Multiple faces detected. Please ensure only one face is visible.',
-                    'student_id': 'Multiple faces',
-                    'confidence': 0.0
-                })
+            client_key = client_reuse_key()
             
             # ================================================================
-            # STEP 4: Extract Face Encoding
+            # STEPS 3-4: Detect / Reuse or Encode (bounded worker pool)
             # ================================================================
-            face_encodings = face_recognition.face_encodings(img_rgb, face_locations)
+            encode_test, failure = _recognition_pool.submit(
+                extract_probe_encoding, img_rgb, client_key
+            ).result(timeout=RECOGNITION_TIMEOUT)
             
-            if len(face_encodings) == 0:
-                return jsonify({
-                    'success': True,
-                    'recognized': False,
-                    'message': 'Could not encode face. Please try again.',
-                    'student_id': 'Encoding failed',
-                    'confidence': 0.0
-                })
-            
-            encode_test = face_encodings[0]
+            if failure is not None:
+                return ojsonify(failure)
             
             # ================================================================
             # STEP 5: Load Known Encodings
@@ -381,29 +890,19 @@ def register_mobile_routes(app):
             data = load_student_encodings()
             
             if data is None:
-                return jsonify({
+                return ojsonify({
                     'success': False,
                     'message': 'Face database not available. Please contact teacher.'
                 }), 500
             
-            encode_list_known = data[0]
-            student_ids = data[1]
+            encode_matrix = data['matrix']
+            student_ids = data['ids']
             
             # ================================================================
             # STEP 6: Compare Faces
             # ================================================================
-            matches = face_recognition.compare_faces(
-                encode_list_known, 
-                encode_test, 
-                tolerance=0.5  # 0.5 is good balance
-            )
-            face_distances = face_recognition.face_distance(
-                encode_list_known, 
-                encode_test
-            )
-            
-            if len(face_distances) == 0:
-                return jsonify({
+            if len(encode_matrix) == 0:
+                return ojsonify({
                     'success': True,
                     'recognized': False,
                     'message': 'No matches found in database',
@@ -412,13 +911,13 @@ def register_mobile_routes(app):
                 })
             
             # Find best match
-            match_index = np.argmin(face_distances)
-            confidence = 1.0 - face_distances[match_index]
+            match_index, distance = find_best_match(data, encode_test)
+            confidence = 1.0 - distance
             
             # ================================================================
             # STEP 7: Verify Match Quality
             # ================================================================
-            if matches[match_index] and confidence > 0.5:
+            if distance < MATCH_TOLERANCE:
                 student_id = student_ids[match_index]
                 
                 # Load student info
@@ -426,12 +925,7 @@ def register_mobile_routes(app):
                 student_info = student_data.get(student_id, {})
                 
                 # Get current lecture
-                teacher_info = {}
-                try:
-                    with open('current_teacher.json', 'r', encoding='utf-8') as f:
-                        teacher_info = json.load(f)
-                except:
-                    pass
+                teacher_info = get_teacher_info()
                 
                 lecture = teacher_info.get('lecture', 'Unknown')
                 
@@ -440,7 +934,7 @@ def register_mobile_routes(app):
                 # ================================================================
                 success, message = mark_attendance(student_id, lecture)
                 
-                return jsonify({
+                return ojsonify({
                     'success': True,
                     'recognized': True,
                     'student_id': student_id,
@@ -451,7 +945,7 @@ def register_mobile_routes(app):
                 })
             else:
                 # Low confidence or no match
-                return jsonify({
+                return ojsonify({
                     'success': True,
                     'recognized': False,
                     'message': f'Face not recognized (confidence: {confidence:.1%}). Please try again.',
@@ -463,7 +957,7 @@ def register_mobile_routes(app):
             print(f"[ERROR] Mobile recognize failed: {e}")
             import traceback
             traceback.print_exc()
-            return jsonify({
+            return ojsonify({
                 'success': False,
                 'message': f'Recognition error: {str(e)}'
             }), 500
@@ -1,5 +1,6 @@
 import cv2
 import face_recognition
+import numpy as np
 import pickle
 import os
 
@@ -50,7 +51,9 @@ def findEncodings(images, ids):
 
 print("\n🚀 Encoding started...")
 encodeListKnown, validIds = findEncodings(imgList, studentIds)
-encodeListKnownWithIds = [encodeListKnown, validIds]
+# Store encodings as a single float32 (N, 128) matrix, same format as attendance_system.train_encodings
+encodeMatrix = np.asarray(encodeListKnown, dtype=np.float32).reshape(-1, 128)
+encodeListKnownWithIds = [encodeMatrix, validIds]
 
 # Save encodings to a pickle file for later recognition
 with open("EncodeFile.p", "wb") as f: